@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Back_end.settings')
 
 application = get_asgi_application()
+
+# Background tasks enabled in settings (OFFER_SCHEDULER_IN_PROCESS, ...): server processes only
+from products.scheduler import start_in_process_runners  # noqa: E402
+
+start_in_process_runners()
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from decimal import Decimal,ROUND_HALF_UP
 from .models import Payment,GSTSetting,CourierChargeSetting
-from products.models import OrderDetails, OrderItem
+from products.models import OrderDetails, OrderItem, Product
+from products.orders import create_order_lines
+from .settings_cache import charge_settings
 from auth_model.models import CustomerDetails
 from django.db import transaction
 
@@ -73,12 +75,10 @@ class OrderDetailsSerializer(serializers.ModelSerializer):
         """
         items_data = validated_data.pop("items")
 
-        # ✅ get GST & shipping from DB settings
-        gst_setting = GSTSetting.objects.first()
-        courier_setting = CourierChargeSetting.objects.first()
-
-        gst_percent = Decimal(getattr(gst_setting, "gst_percentage", 0) or 0)
-        shipping_cost = Decimal(getattr(courier_setting, "courier_charge", 0) or 0)
+        # ✅ get GST & shipping from the settings (cached per process, see settings_cache.py)
+        self.charges = charge_settings()
+        gst_percent = self.charges.gst_percentage
+        shipping_cost = self.charges.courier_charge
 
         subtotal = Decimal("0.00")
         order_items = []
@@ -112,16 +112,11 @@ class OrderDetailsSerializer(serializers.ModelSerializer):
         # ---------- create Order header ----------
         order = OrderDetails.objects.create(**validated_data)
 
-        # ---------- create Order items (no stock change here) ----------
-        for product, quantity, unit_price, line_tax, line_total in order_items:
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=unit_price,
-                tax=line_tax,
-                total=line_total,
-            )
+        # ---------- create Order items in one INSERT (no stock change here) ----------
+        create_order_lines(order, [
+            {"product": product, "quantity": quantity, "price": unit_price, "tax": line_tax}
+            for product, quantity, unit_price, line_tax, line_total in order_items
+        ])
 
         return order
 
@@ -134,6 +129,42 @@ class PaymentSerializer(serializers.ModelSerializer):
         fields = ["razorpay_order_id", "razorpay_payment_id", "status", "amount", "method"]
 
 
+# -------------------------------
+# Order History Summary Serializer
+# -------------------------------
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Order header with item count and first product's image, no lines. Reads
+    the item_count / thumbnail annotations of CustomerOrderHistoryView's
+    summary queryset (payment/views.py).
+    """
+    # Annotated on the queryset, not columns of order_details
+    annotated_fields = ("item_count", "thumbnail")
+
+    item_count = serializers.IntegerField(read_only=True)
+    thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderDetails
+        fields = [
+            "id",
+            "order_number",
+            "status",
+            "payment_status",
+            "payment_method",
+            "total_amount",
+            "ordered_at",
+            "delivered_at",
+            "item_count",
+            "thumbnail",
+        ]
+
+    def get_thumbnail(self, obj):
+        if not obj.thumbnail:
+            return None
+        return Product._meta.get_field("product_image").storage.url(obj.thumbnail)
+
+
 # -------------------------------
 # Order Tracking Serializer
 # -------------------------------
@@ -0,0 +1,113 @@
+"""
+Process-wide cache of the GST and courier charge settings.
+
+Both are singleton rows that change a few times a year, but are read on
+every reserve, order and invoice. charge_settings() loads them once per
+process and serves the same ChargeSettings until they change.
+
+GSTSettingView / CourierChargeSettingView call invalidate() after a PUT.
+On PostgreSQL that NOTIFYs SETTINGS_CHANNEL after commit, and the LISTEN
+thread of every worker (products/push.py) drops its copy. As a safety net
+(other backends, or a listener that is down) a copy is never served for
+longer than CHARGE_SETTINGS_TTL seconds.
+
+``version`` identifies the rates in use and is sent back as the
+X-Charge-Settings-Version header by the endpoints that price with them.
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from products.push import listen_channel
+
+from .models import CourierChargeSetting, GSTSetting
+
+SETTINGS_CHANNEL = "payment_settings"
+
+VERSION_HEADER = "X-Charge-Settings-Version"
+
+
+@dataclass(frozen=True)
+class ChargeSettings:
+    gst_percentage: Decimal     # 0 when no GSTSetting row exists
+    courier_charge: Decimal
+    version: str
+    gst_configured: bool        # False without a GSTSetting row (invoices use their own default)
+
+
+def _ttl():
+    return getattr(settings, "CHARGE_SETTINGS_TTL", 300)
+
+
+def _load():
+    gst_setting = GSTSetting.objects.first()
+    courier_setting = CourierChargeSetting.objects.first()
+
+    gst_percentage = Decimal(getattr(gst_setting, "gst_percentage", 0) or 0)
+    courier_charge = Decimal(getattr(courier_setting, "courier_charge", 0) or 0)
+
+    raw = f"gst={gst_percentage:.2f};courier={courier_charge:.2f}"
+    version = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+    return ChargeSettings(gst_percentage, courier_charge, version, gst_setting is not None)
+
+
+_lock = threading.Lock()
+_cached = None        # (ChargeSettings, loaded_at)
+_generation = 0       # bumped by every clear, so a load racing a clear is not kept
+_listening = False
+
+
+def clear():
+    """Drop this process's copy (the next read reloads)."""
+    global _cached, _generation
+    with _lock:
+        _cached = None
+        _generation += 1
+
+
+def _start_listening():
+    global _listening
+    if _listening:
+        return
+    _listening = True
+    # Reconnects clear too: a change may have been missed meanwhile
+    listen_channel(SETTINGS_CHANNEL, lambda payloads: clear(), clear)
+
+
+def charge_settings():
+    """Current GST percentage and courier charge, from memory when possible."""
+    global _cached
+    _start_listening()
+
+    with _lock:
+        cached, generation = _cached, _generation
+    if cached is not None and time.monotonic() - cached[1] < _ttl():
+        return cached[0]
+
+    value = _load()
+    with _lock:
+        if _generation == generation:
+            _cached = (value, time.monotonic())
+    return value
+
+
+def _broadcast():
+    clear()
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [SETTINGS_CHANNEL, ""])
+
+
+def invalidate():
+    """After changing GSTSetting / CourierChargeSetting: drop every worker's copy once committed."""
+    transaction.on_commit(_broadcast)
+
+
+def tag_response(response, charges):
+    response[VERSION_HEADER] = charges.version
+    return response
@@ -1,9 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status
-from .serializers import OrderDetailsSerializer,OrderTrackingSerializer,GSTSettingSerializer,CourierChargeSettingSerializer
+from .serializers import OrderDetailsSerializer,OrderSummarySerializer,OrderTrackingSerializer,GSTSettingSerializer,CourierChargeSettingSerializer
 from .models import  Payment,GSTSetting,CourierChargeSetting
 from products.models import OrderDetails,Product,OrderItem
+from products.inventory import hold_items, check_holds, release_holds, commit_stock
+from .settings_cache import charge_settings, invalidate, tag_response
 from auth_model.models import CustomerDetails
 from django.shortcuts import get_object_or_404
 import razorpay
@@ -14,6 +16,7 @@ from django.conf import settings
 from razorpay.errors import SignatureVerificationError
 from rest_framework.pagination import PageNumberPagination
 from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
 from decimal import Decimal, ROUND_HALF_UP
 
@@ -47,49 +50,25 @@ class ReserveOrderAPIView(APIView):
         try:
             with transaction.atomic():
                 subtotal = Decimal("0.00")
-                gst_setting = GSTSetting.objects.first()
-                courier_setting = CourierChargeSetting.objects.first()
+                charges = charge_settings()
 
-                gst_percent = Decimal(getattr(gst_setting, "gst_percentage", 0) or 0)
-                shipping_cost = Decimal(getattr(courier_setting, "courier_charge", 0) or 0)
+                gst_percent = charges.gst_percentage
+                shipping_cost = charges.courier_charge
 
                 # ---------- Reserve stock & compute subtotal ----------
+                lines = {}
                 for item in items:
-                    product_id = item["product"]
-                    quantity = int(item["quantity"])
-
-                    product = Product.objects.select_for_update().get(id=product_id)
-
-                    # Clear expired reservation
-                    if product.reserved_until and product.reserved_until < timezone.now():
-                        product.reserved_by = None
-                        product.reserved_until = None
-                        product.save()
-
-                    # Check if reserved by another user
-                    if (
-                        product.reserved_by
-                        and product.reserved_by != customer
-                        and product.reserved_until > timezone.now()
-                    ):
-                        raise ValueError(
-                            f"Sorry, {product.product_name} is being checked out by another user."
-                        )
-
-                    if product.stock_quantity < quantity:
-                        raise ValueError(
-                            f"Insufficient stock for {product.product_name}. Only {product.stock_quantity} left."
-                        )
+                    product_id = int(item["product"])
+                    lines[product_id] = lines.get(product_id, 0) + int(item["quantity"])
 
+                # Quantity holds: buyers share stock instead of locking the product
+                products = hold_items(customer, lines, RESERVATION_DURATION)
+
+                for product_id, quantity in lines.items():
                     # compute price (you can enhance: respect offers here)
-                    unit_price = product.price
+                    unit_price = products[product_id].price
                     subtotal += unit_price * quantity
 
-                    # Reserve for this customer
-                    product.reserved_by = customer
-                    product.reserved_until = timezone.now() + RESERVATION_DURATION
-                    product.save()
-
                 subtotal = subtotal.quantize(Decimal("0.00"))
                 gst_amount = (subtotal * gst_percent / Decimal("100")).quantize(Decimal("0.00"))
                 total_amount = (subtotal + gst_amount + shipping_cost).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
@@ -113,7 +92,7 @@ class ReserveOrderAPIView(APIView):
                         status="created",
                     )
 
-                return Response(
+                return tag_response(Response(
                     {
                         "status": True,
                         "message": "Products reserved successfully.",
@@ -127,7 +106,7 @@ class ReserveOrderAPIView(APIView):
                         },
                     },
                     status=201,
-                )
+                ), charges)
 
         except ValueError as e:
             return Response({"status": False, "message": str(e)}, status=400)
@@ -196,15 +175,12 @@ class VerifyPaymentAndCreateOrderAPIView(APIView):
         try:
             with transaction.atomic():
                 # check stock & reservation again before commit
+                lines = {}
                 for item in items_data:
-                    product = Product.objects.select_for_update().get(id=item["product"])
-                    quantity = int(item["quantity"])
+                    product_id = int(item["product"])
+                    lines[product_id] = lines.get(product_id, 0) + int(item["quantity"])
 
-                    if product.reserved_by_id != customer.id:
-                        raise ValueError(f"{product.product_name} reservation not found or expired.")
-
-                    if product.stock_quantity < quantity:
-                        raise ValueError(f"Insufficient stock for {product.product_name}")
+                check_holds(customer, lines)
 
                 # create order & items (serializer computes totals from DB)
                 order = serializer.save(
@@ -213,20 +189,11 @@ class VerifyPaymentAndCreateOrderAPIView(APIView):
                     payment_method=OrderDetails.PaymentMethod.ONLINE,
                 )
 
-                # now deduct stock & clear reservation
-                for item in order.items.all():
-                    product = item.product
-                    quantity = item.quantity
-
-                    if product.stock_quantity < quantity:
-                        raise ValueError(f"Insufficient stock for {product.product_name}")
+                # now deduct stock (one guarded UPDATE) & clear reservation
+                commit_stock(lines)
 
-                    product.stock_quantity -= quantity
-                    if product.stock_quantity <= 0:
-                        product.is_available = False
-                    product.reserved_by = None
-                    product.reserved_until = None
-                    product.save()
+                # the order now owns this stock
+                release_holds(customer, lines)
 
                 # update Payment record
                 pay_rec.order = order
@@ -234,14 +201,14 @@ class VerifyPaymentAndCreateOrderAPIView(APIView):
                 pay_rec.status = "success"
                 pay_rec.save(update_fields=["order", "razorpay_payment_id", "status"])
 
-                return Response(
+                return tag_response(Response(
                     {
                         "status": True,
                         "message": "Payment verified & order placed successfully.",
                         "order": OrderDetailsSerializer(order).data,
                     },
                     status=201,
-                )
+                ), serializer.charges)
 
         except ValueError as e:
             return Response({"status": False, "message": str(e)}, status=400)
@@ -269,43 +236,28 @@ class CreateCODOrderAPIView(APIView):
 
         try:
             with transaction.atomic():
-                # stock lock & validation
-                for item in items_data:
-                    product = Product.objects.select_for_update().get(id=item["product"])
-                    quantity = int(item["quantity"])
-
-                    if product.stock_quantity < quantity:
-                        raise ValueError(
-                            f"Insufficient stock for {product.product_name}. Only {product.stock_quantity} left."
-                        )
-
                 # create order & items (totals computed by serializer)
                 order = serializer.save(
                     payment_method=OrderDetails.PaymentMethod.COD,
                     payment_status=OrderDetails.PaymentStatus.PENDING,
                 )
 
-                # deduct stock
-                for item in order.items.all():
-                    product = item.product
-                    quantity = item.quantity
-
-                    if product.stock_quantity < quantity:
-                        raise ValueError(f"Insufficient stock for {product.product_name}")
+                # deduct stock: one guarded UPDATE, rolls the order back if a line does not fit
+                lines = {}
+                for item in items_data:
+                    product_id = int(item["product"])
+                    lines[product_id] = lines.get(product_id, 0) + int(item["quantity"])
 
-                    product.stock_quantity -= quantity
-                    if product.stock_quantity <= 0:
-                        product.is_available = False
-                    product.save()
+                commit_stock(lines)
 
-                return Response(
+                return tag_response(Response(
                     {
                         "status": True,
                         "message": "Order placed successfully with Cash on Delivery.",
                         "order": OrderDetailsSerializer(order).data,
                     },
                     status=201,
-                )
+                ), serializer.charges)
 
         except ValueError as e:
             return Response({"status": False, "message": str(e)}, status=400)
@@ -345,24 +297,58 @@ class OrderTrackingAPIView(APIView):
         
 
 class CustomerOrderHistoryView(generics.ListAPIView):
+    """
+    A customer's orders, newest first. Full lines by default; ``?summary=true``
+    returns headers with item count and a thumbnail. Constant queries per page.
+    """
     serializer_class = OrderDetailsSerializer
     pagination_class = OrderHistoryPagination
 
+    def is_summary(self):
+        return self.request.query_params.get("summary", "false").lower() == "true"
+
+    def get_serializer_class(self):
+        return OrderSummarySerializer if self.is_summary() else OrderDetailsSerializer
+
     def get_queryset(self):
         customer_id = self.kwargs.get("customer_id")
-        return OrderDetails.objects.filter(customer_id=customer_id).order_by("-created_at")
+        orders = OrderDetails.objects.filter(customer_id=customer_id).order_by("-created_at")
+
+        if self.is_summary():
+            # 🧾 Header + item count + first product's image, no lines
+            first_image = (
+                OrderItem.objects.filter(order=OuterRef("pk")).order_by("id").values("product__product_image")[:1]
+            )
+            header_fields = [
+                f for f in OrderSummarySerializer.Meta.fields if f not in OrderSummarySerializer.annotated_fields
+            ]
+            return orders.only(*header_fields, "created_at").annotate(
+                item_count=Count("items"),
+                thumbnail=Subquery(first_image),
+            )
+
+        # 📦 Lines with just the product columns the serializer prints, one prefetch per page
+        header_fields = [f for f in OrderDetailsSerializer.Meta.fields if f not in ("items", "customer")]
+        return orders.only(*header_fields, "customer_id", "created_at").prefetch_related(
+            Prefetch(
+                "items",
+                queryset=OrderItem.objects.select_related("product").only(
+                    "id", "order_id", "quantity", "price", "tax", "total",
+                    "product__id", "product__product_name", "product__product_image",
+                ).order_by("id"),
+            )
+        )
 
     def list(self, request, *args, **kwargs):
-        customer_id = self.kwargs.get("customer_id")
-        queryset = self.get_queryset()
+        page = self.paginate_queryset(self.get_queryset())
 
-        if not queryset.exists():
+        # The page count already tells us whether the customer has orders
+        if not self.paginator.page.paginator.count:
             return Response(
                 {"message": "No orders found for this customer."},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
     
@@ -378,6 +364,8 @@ class GSTSettingView(APIView):
         serializer = GSTSettingSerializer(setting, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            # Every worker reloads the rates on next use
+            invalidate()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -393,6 +381,8 @@ class CourierChargeSettingView(APIView):
         serializer = CourierChargeSettingSerializer(setting, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            # Every worker reloads the rates on next use
+            invalidate()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
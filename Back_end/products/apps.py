@@ -6,3 +6,6 @@ class ProductsConfig(AppConfig):
 
     def ready(self):
         import products.signals  
+
+        # In-process background tasks start from the server entry points
+        # (products.scheduler.start_in_process_runners), not here.
@@ -0,0 +1,197 @@
+"""
+Product cards: one precomputed listing row per parent product.
+
+The storefront list endpoints used to resolve, for every product on every
+request, which product to display (main or a variant), which offer applies
+and how much stock is free. That resolution now happens here, on writes,
+and the result is stored in ``ProductCard``.
+
+Rules (same as ProductWithOfferSerializer.to_representation):
+  A. main product has an active offer  -> show main with its offer
+  B. an in-stock variant has an offer   -> show that variant with its offer
+  C. no offer anywhere                  -> main if in stock, else first
+                                           in-stock variant, else main
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Min, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, ProductCard, ProductReservation
+
+CARD_UPDATE_FIELDS = [
+    "display_product",
+    "active_variant",
+    "offer_percentage",
+    "offer_price",
+    "active_variant_offer_price",
+    "available_stock",
+    "expires_at",
+    "refreshed_at",
+]
+
+
+def get_active_offer(product, today):
+    """First active offer from the (prefetched) offers of a product (OfferDetails.applies_on)."""
+    for offer in product.offers.all():
+        if offer.applies_on(today):
+            return offer
+    return None
+
+
+def discounted_price(product, offer):
+    if not offer:
+        return None
+    pct = Decimal(offer.offer_percentage) / Decimal(100)
+    return (Decimal(product.price) * (Decimal(1) - pct)).quantize(Decimal("0.01"))
+
+
+def resolve_card(product, today):
+    """
+    Apply rules A/B/C to a parent product whose ``offers`` and
+    ``variants__offers`` are prefetched. Returns an unsaved ProductCard
+    (available_stock / expires_at are filled in by refresh_product_cards).
+    """
+    in_stock_variants = [v for v in product.variants.all() if v.is_available and v.stock_quantity > 0]
+
+    main_offer = get_active_offer(product, today)
+
+    variant_with_offer, variant_offer = None, None
+    for v in in_stock_variants:
+        offer = get_active_offer(v, today)
+        if offer:
+            variant_with_offer, variant_offer = v, offer
+            break
+
+    if main_offer:
+        display, offer = product, main_offer                      # Rule A
+    elif variant_with_offer:
+        display, offer = variant_with_offer, variant_offer        # Rule B
+    elif product.stock_quantity > 0:
+        display, offer = product, None                            # Rule C, main in stock
+    elif in_stock_variants:
+        display, offer = in_stock_variants[0], None               # Rule C, variant in stock
+    else:
+        display, offer = product, None                            # Rule C, nothing in stock
+
+    # "active_variant" is only offered alongside the main product when
+    # the main product itself cannot be bought.
+    active_variant = None
+    if display is product and (product.stock_quantity <= 0 or not product.is_available):
+        active_variant = in_stock_variants[0] if in_stock_variants else None
+
+    return ProductCard(
+        product=product,
+        display_product=display,
+        active_variant=active_variant,
+        offer_percentage=offer.offer_percentage if offer else None,
+        offer_price=discounted_price(display, offer),
+        active_variant_offer_price=(
+            discounted_price(active_variant, get_active_offer(active_variant, today))
+            if active_variant else None
+        ),
+    )
+
+
+def _start_of(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def _next_offer_boundary(product, today):
+    """Earliest date after today on which one of the product's offers starts or ends."""
+    boundaries = []
+    for p in [product, *product.variants.all()]:
+        for offer in p.offers.all():
+            if not offer.is_active or not offer.offer_percentage:
+                continue
+            if offer.start_date and offer.start_date > today:
+                boundaries.append(offer.start_date)
+            elif offer.end_date and offer.end_date >= today:
+                boundaries.append(offer.end_date + timedelta(days=1))
+    return _start_of(min(boundaries)) if boundaries else None
+
+
+def refresh_product_cards(product_ids):
+    """Recompute the cards of the given parent product ids."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    now = timezone.now()
+    today = now.date()
+
+    products = (
+        Product.objects.filter(id__in=product_ids, parent__isnull=True)
+        .prefetch_related(
+            "offers",
+            Prefetch("variants", queryset=Product.objects.prefetch_related("offers")),
+        )
+    )
+
+    cards = [(product, resolve_card(product, today)) for product in products]
+
+    # Active holds for every displayed product in one grouped query
+    held = {
+        row["product_id"]: row
+        for row in ProductReservation.objects.filter(
+            product_id__in=[card.display_product_id for _, card in cards],
+            reserved_until__gt=now,
+        ).values("product_id").annotate(total=Sum("quantity"), soonest=Min("reserved_until"))
+    }
+
+    for product, card in cards:
+        hold = held.get(card.display_product_id)
+        card.available_stock = card.display_product.stock_quantity - (hold["total"] if hold else 0)
+
+        expiries = [d for d in (_next_offer_boundary(product, today), hold and hold["soonest"]) if d]
+        card.expires_at = min(expiries) if expiries else None
+
+    ProductCard.objects.bulk_create(
+        [card for _, card in cards],
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=CARD_UPDATE_FIELDS,
+    )
+
+    # Ids that are no longer parent products keep no card
+    ProductCard.objects.filter(product_id__in=product_ids).exclude(
+        product_id__in=[product.id for product, _ in cards]
+    ).delete()
+
+
+def refresh_cards_for(product_ids):
+    """Refresh the cards affected by changes to any product (main or variant)."""
+    product_ids = set(product_ids)
+    parent_ids = (
+        Product.objects.filter(id__in=product_ids)
+        .annotate(card_id=Coalesce("parent_id", "id"))
+        .values_list("card_id", flat=True)
+    )
+    # The ids themselves too: one that just became a variant loses its own card
+    refresh_product_cards(product_ids.union(parent_ids))
+
+
+def schedule_card_refresh(product_ids):
+    """Refresh once the surrounding transaction commits (immediately in autocommit)."""
+    product_ids = [pid for pid in product_ids if pid]
+    if product_ids:
+        transaction.on_commit(lambda: refresh_cards_for(product_ids))
+
+
+def refresh_stale_cards():
+    """Refresh cards whose offer window or reservation hold has run out."""
+    stale_ids = list(
+        ProductCard.objects.filter(expires_at__lte=timezone.now()).values_list("product_id", flat=True)
+    )
+    refresh_product_cards(stale_ids)
+
+
+def product_cards():
+    """Up-to-date cards, ready to serialize with ProductCardSerializer."""
+    refresh_stale_cards()
+    return ProductCard.objects.select_related(
+        "product__category", "display_product", "active_variant"
+    )
@@ -0,0 +1,182 @@
+"""
+Database-backed queue for heavy PDF exports.
+
+The PDF endpoints enqueue an ExportJob when called with ``?async=true``.
+``manage.py run_export_worker`` claims queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED and renders them in a process pool, so
+any number of workers can share the table without a broker. Clients poll
+the job status endpoint and fetch the file from its download endpoint.
+
+A running job's heartbeat_at is refreshed while it renders. Only a job
+whose heartbeat is older than EXPORT_JOB_TIMEOUT (its worker died) is
+queued again, and a runner only stores its result while the job is still
+the attempt it claimed.
+"""
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .labels import label_orders, write_address_labels, write_single_label
+from .models import ExportJob, OrderDetails
+from .pdf import get_invoice
+from .scheduler import PeriodicRunner
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+def _job_timeout():
+    """Seconds without a heartbeat after which a running job is considered abandoned."""
+    return getattr(settings, "EXPORT_JOB_TIMEOUT", 600)
+
+
+def _heartbeat_interval():
+    return max(1, _job_timeout() // 4)
+
+
+# ---------------------------------------------------------------
+# Renderers: params -> (download filename, open file object)
+# ---------------------------------------------------------------
+def _render_invoice(params):
+    invoice = get_invoice(OrderDetails.objects.get(pk=params["order_id"]))
+    return f"invoice_{invoice.invoice_number}.pdf", invoice.pdf.open("rb")
+
+
+def _render_address_labels(params):
+    return "address_labels.pdf", write_address_labels(label_orders(params["order_ids"]))
+
+
+def _render_single_label(params):
+    return "single_address_label.pdf", write_single_label(OrderDetails.objects.get(pk=params["order_id"]))
+
+
+RENDERERS = {
+    ExportJob.Kind.INVOICE: _render_invoice,
+    ExportJob.Kind.ADDRESS_LABELS: _render_address_labels,
+    ExportJob.Kind.SINGLE_LABEL: _render_single_label,
+}
+
+
+def enqueue_export(kind, **params):
+    return ExportJob.objects.create(kind=kind, params=params)
+
+
+# ---------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------
+def claim_jobs(limit):
+    """Mark up to ``limit`` queued jobs as running and return their ids (oldest first)."""
+    with transaction.atomic():
+        job_ids = list(
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ExportJob.Status.QUEUED)
+            .order_by("created_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        now = timezone.now()
+        ExportJob.objects.filter(id__in=job_ids).update(
+            status=ExportJob.Status.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return job_ids
+
+
+def requeue_stale_jobs():
+    """Jobs left running by a dead worker (no heartbeat): retry them, or fail after MAX_ATTEMPTS."""
+    cutoff = timezone.now() - timedelta(seconds=_job_timeout())
+    stale = ExportJob.objects.filter(status=ExportJob.Status.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    stale.filter(attempts__lt=MAX_ATTEMPTS).update(status=ExportJob.Status.QUEUED)
+    stale.update(status=ExportJob.Status.FAILED, error="Timed out", finished_at=timezone.now())
+
+
+def run_export_job(job_id):
+    """Render one claimed job and store its file. Runs inside a pool process."""
+    close_old_connections()
+    job = ExportJob.objects.get(pk=job_id)
+    # This run owns the job only while it is still the attempt it was claimed as
+    owned = ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.RUNNING, attempts=job.attempts)
+
+    def beat():
+        owned.update(heartbeat_at=timezone.now())
+
+    heartbeat = PeriodicRunner(f"export-heartbeat-{job.pk}", beat, max_interval=_heartbeat_interval())
+    heartbeat.start()
+    try:
+        filename, fileobj = RENDERERS[job.kind](job.params)
+        with fileobj:
+            job.result.save(f"{job.id}.pdf", File(fileobj), save=False)
+        job.filename = filename
+        job.status = ExportJob.Status.DONE
+        job.error = ""
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        job.status = ExportJob.Status.FAILED
+        job.error = str(e)
+    finally:
+        heartbeat.stop()
+        heartbeat.join()
+        job.finished_at = timezone.now()
+        stored = owned.update(
+            result=job.result.name or None,
+            filename=job.filename,
+            status=job.status,
+            error=job.error,
+            finished_at=job.finished_at,
+        )
+        if not stored:
+            # Requeued or finished elsewhere meanwhile: that run's result stands
+            logger.warning("Export job %s was taken over, discarding this result", job_id)
+            if job.result:
+                job.result.delete(save=False)
+        close_old_connections()
+
+    return job.status
+
+
+def run_worker(workers=2, poll_interval=2, once=False):
+    """
+    Claim jobs whenever a pool slot is free and render them in ``workers``
+    processes. With ``once``, stop when the queue is drained.
+    """
+    # Pool processes are spawned, not forked: the pool starts them lazily on
+    # submit, and a fork then would copy the claim query's open connection.
+    # A spawned process inherits no connections and only needs Django set up.
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+    with pool:
+        running = set()
+        while True:
+            requeue_stale_jobs()
+
+            free = workers - len(running)
+            if free > 0:
+                running |= {pool.submit(run_export_job, job_id) for job_id in claim_jobs(free)}
+
+            if not running:
+                if once:
+                    return
+                close_old_connections()
+                time.sleep(poll_interval)
+                continue
+
+            done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception():
+                    logger.error("Export worker process failed: %s", future.exception())
@@ -0,0 +1,60 @@
+"""
+Favorite flags for product listings.
+
+Listings mark the customer's favorites in the same query (with_is_favorite)
+and the storefront gets flags for a whole page of ids in one call
+(favorite_flags), both served by the (customer, product) index on
+FavoriteProduct. Customers are identified by auth id, as in the other
+favorites endpoints.
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import FavoriteProduct
+
+# Most ids favorite_flags() answers for in one call: a page of products (ProductSetPagination.max_page_size)
+MAX_FLAG_PRODUCTS = 100
+
+
+def request_auth_id(request, strict=False):
+    """
+    The authenticated user's id, else the ``auth_id`` query parameter (None
+    if neither). A non-numeric ``auth_id`` counts as none, or raises
+    ValueError with ``strict`` (even when a user is logged in).
+    """
+    auth_id = request.query_params.get("auth_id")
+    try:
+        auth_id = int(auth_id) if auth_id else None
+    except ValueError:
+        if strict:
+            raise
+        auth_id = None
+
+    if request.user and request.user.is_authenticated:
+        return request.user.id
+    return auth_id
+
+
+def parse_product_ids(raw):
+    """'1,2,3' (or a list) -> [1, 2, 3]; raises ValueError on anything else."""
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(",") if part.strip()]
+    return [int(pid) for pid in raw]
+
+
+def favorites_of(auth_id):
+    return FavoriteProduct.objects.filter(customer__auth_id=auth_id)
+
+
+def favorite_flags(auth_id, product_ids):
+    """{product_id: bool} for ``product_ids``, from one query."""
+    favorite_ids = set(
+        favorites_of(auth_id).filter(product_id__in=product_ids).values_list("product_id", flat=True)
+    )
+    return {pid: pid in favorite_ids for pid in product_ids}
+
+
+def with_is_favorite(queryset, auth_id, product_field="pk"):
+    """Annotate ``is_favorite`` (EXISTS subquery) on a queryset of products or cards."""
+    return queryset.annotate(
+        is_favorite=Exists(favorites_of(auth_id).filter(product_id=OuterRef(product_field)))
+    )
@@ -0,0 +1,47 @@
+"""
+Product hierarchy (Product.parent -> variants) resolved in the database.
+
+product_tree() returns a RawSQL subquery of every product id under the
+given roots, walked with one recursive CTE instead of a query per node.
+Use it as ``filter(product_id__in=product_tree(...))`` so the whole
+filter becomes a single subquery join. UNION (not UNION ALL) drops ids
+already seen, so a cycle in ``parent`` cannot loop forever.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+def product_tree(product_id=None, category_id=None):
+    """
+    Ids of the root products and all their descendants. Roots are
+    ``product_id``, or every product in ``category_id`` (both: the
+    product, if it is in that category).
+    """
+    qn = connection.ops.quote_name
+    table = qn(Product._meta.db_table)
+    pk = qn(Product._meta.pk.column)
+    parent = qn(Product._meta.get_field("parent").column)
+    category = qn(Product._meta.get_field("category").column)
+
+    conditions, params = [], []
+    if product_id is not None:
+        conditions.append(f"{pk} = %s")
+        params.append(product_id)
+    if category_id is not None:
+        conditions.append(f"{category} = %s")
+        params.append(category_id)
+    where = " AND ".join(conditions) or "1 = 1"
+
+    return RawSQL(
+        f"""
+        WITH RECURSIVE tree (id) AS (
+            SELECT {pk} FROM {table} WHERE {where}
+            UNION
+            SELECT child.{pk} FROM {table} AS child JOIN tree ON child.{parent} = tree.id
+        )
+        SELECT id FROM tree
+        """,
+        params,
+    )
@@ -0,0 +1,325 @@
+"""
+Stock reservations (checkout holds).
+
+A hold is a ProductReservation row: ``quantity`` units of a product kept
+for one customer until ``reserved_until``. Free stock is stock_quantity
+minus the active holds of everyone else (ProductQuerySet.with_available_stock).
+
+reserve_cart() applies a whole cart in a constant number of statements:
+one locking read that also computes availability, one delete and one
+bulk upsert, so lock hold time does not grow with the number of lines.
+
+Expired holds are ignored by every read and purged in batches by
+sweep_expired_reservations(), run from ``manage.py sweep_reservations``
+or in-process in the server processes with RESERVATION_SWEEPER_IN_PROCESS
+= True (one sweeper at a time, see products/scheduler.py).
+
+commit_stock() takes ordered quantities out of stock in one guarded
+UPDATE when an order is written.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .cards import schedule_card_refresh
+from .models import Product, ProductReservation
+
+RESERVATION_MINUTES = 10
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def _lock_product_rows(product_ids):
+    """SELECT ... FOR UPDATE the products in id order. Returns the ids that exist."""
+    return list(
+        Product.objects.select_for_update()
+        .filter(id__in=list(product_ids))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def reserve_cart(user, cart_map, minutes=RESERVATION_MINUTES):
+    """
+    Hold ``cart_map`` ({product_id: qty}) for ``user``, capped at free stock.
+
+    Returns (reserved_items, updated_items, removed_items):
+      reserved_items  lines held, with the product details the client shows
+      updated_items   lines reduced to what is free ({id, old_qty, new_qty})
+      removed_items   product ids missing or out of stock (their holds are dropped)
+    """
+    reserved_items, updated_items, removed_items = [], [], []
+
+    with transaction.atomic():
+        # Lock product rows in a deterministic order to avoid deadlocks, then
+        # read free stock (excluding this user's own holds) in a second
+        # statement: under READ COMMITTED that one sees the holds committed by
+        # whoever held the lock before us
+        _lock_product_rows(cart_map)
+        products = {
+            p.id: p
+            for p in Product.objects.filter(id__in=list(cart_map)).with_available_stock(for_user=user)
+        }
+
+        now = timezone.now()
+        expire_at = now + timedelta(minutes=minutes)
+
+        holds = []
+        for pid, requested_qty in cart_map.items():
+            product = products.get(pid)
+            if not product or product.available_qty <= 0:
+                removed_items.append(pid)
+                continue
+
+            # If requested > available -> reduce
+            reserve_qty = min(requested_qty, product.available_qty)
+            if reserve_qty < requested_qty:
+                updated_items.append({"id": pid, "old_qty": requested_qty, "new_qty": reserve_qty})
+
+            holds.append(ProductReservation(user=user, product=product, quantity=reserve_qty, reserved_until=expire_at))
+
+            reserved_items.append({
+                "product_id": pid,
+                "qty": reserve_qty,
+                "product_name": product.product_name,
+                "price": str(product.price),         # JSON friendly
+                "offer_price": str(product.offer_price) if hasattr(product, "offer_price") and product.offer_price is not None else None,
+                "product_image": product.product_image.url if product.product_image else None,
+            })
+
+        if removed_items:
+            ProductReservation.objects.filter(user=user, product_id__in=removed_items).delete()
+
+        # One upsert on the (user, product) unique key creates or extends every hold
+        ProductReservation.objects.bulk_create(
+            holds,
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity", "reserved_until"],
+        )
+
+        # bulk_create sends no post_save: refresh the affected product cards here
+        schedule_card_refresh([hold.product_id for hold in holds])
+
+    return reserved_items, updated_items, removed_items
+
+
+# ---------------------------------------------------------------
+# Payment-flow holds (payment/views.py)
+#
+# Any number of customers can hold the same product at once, as long as
+# the holds fit in stock_quantity.
+# ---------------------------------------------------------------
+class InsufficientStock(ValueError):
+
+    def __init__(self, message, product_ids=()):
+        super().__init__(message)
+        self.product_ids = list(product_ids)
+
+
+def _lock_products(product_ids, user, lock=True):
+    """Lock the products in id order and annotate free stock excluding ``user``'s holds."""
+    if lock:
+        # Lock first, read availability after: see reserve_cart()
+        _lock_product_rows(product_ids)
+    products = {
+        p.id: p
+        for p in Product.objects.filter(id__in=list(product_ids)).with_available_stock(for_user=user)
+    }
+    missing = set(product_ids) - set(products)
+    if missing:
+        raise Product.DoesNotExist(f"Product {min(missing)} not found")
+    return products
+
+
+def hold_items(user, lines, duration):
+    """
+    Hold ``lines`` ({product_id: qty}) for ``user`` for ``duration``, all or
+    nothing. Raises InsufficientStock when a line does not fit in the stock
+    left after other customers' holds. Returns {product_id: Product}.
+    """
+    with transaction.atomic():
+        products = _lock_products(lines, user)
+
+        for pid, qty in lines.items():
+            product = products[pid]
+            if product.available_qty < qty:
+                raise InsufficientStock(
+                    f"Insufficient stock for {product.product_name}. Only {max(product.available_qty, 0)} left."
+                )
+
+        expire_at = timezone.now() + duration
+        ProductReservation.objects.bulk_create(
+            [ProductReservation(user=user, product_id=pid, quantity=qty, reserved_until=expire_at) for pid, qty in lines.items()],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity", "reserved_until"],
+        )
+        schedule_card_refresh(list(lines))
+
+    return products
+
+
+def check_holds(user, lines):
+    """
+    Before taking payment into an order: every line must be covered by
+    ``user``'s active hold, or (if the hold ran out) still fit in free stock.
+    Nothing is locked; commit_stock() is what guarantees the stock.
+    """
+    products = _lock_products(lines, user, lock=False)
+    held = dict(
+        ProductReservation.objects.filter(
+            user=user, product_id__in=list(lines), reserved_until__gt=timezone.now()
+        ).values_list("product_id", "quantity")
+    )
+
+    for pid, qty in lines.items():
+        product = products[pid]
+        if held.get(pid, 0) >= qty and product.stock_quantity >= qty:
+            continue
+        if product.available_qty >= qty:
+            continue
+        if pid not in held:
+            raise InsufficientStock(f"{product.product_name} reservation not found or expired.")
+        raise InsufficientStock(f"Insufficient stock for {product.product_name}")
+
+    return products
+
+
+def release_holds(user, product_ids):
+    """Drop ``user``'s holds once the order that consumed them is written."""
+    ProductReservation.objects.filter(user=user, product_id__in=list(product_ids)).delete()
+
+
+# ---------------------------------------------------------------
+# Stock commit
+# ---------------------------------------------------------------
+def _commit_stock_postgresql(lines):
+    """One UPDATE ... FROM (VALUES ...) for every line. Returns the ids that were decremented."""
+    table = connection.ops.quote_name(Product._meta.db_table)
+    values = ", ".join(["(%s::bigint, %s::integer)"] * len(lines))
+    params = [v for pid, qty in lines.items() for v in (pid, qty)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS p
+               SET stock_quantity = p.stock_quantity - v.qty,
+                   is_available = CASE WHEN p.stock_quantity - v.qty <= 0 THEN false ELSE p.is_available END,
+                   updated_at = %s
+              FROM (VALUES {values}) AS v(id, qty)
+             WHERE p.id = v.id AND p.stock_quantity >= v.qty
+         RETURNING p.id
+            """,
+            [timezone.now(), *params],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _commit_stock_generic(lines):
+    """Same guarded decrement as one UPDATE per line, for other databases."""
+    committed = set()
+    for pid, qty in lines.items():
+        if Product.objects.filter(id=pid, stock_quantity__gte=qty).update(
+            stock_quantity=F("stock_quantity") - qty,
+            is_available=Case(When(stock_quantity__lte=qty, then=False), default=F("is_available")),
+            updated_at=timezone.now(),
+        ):
+            committed.add(pid)
+    return committed
+
+
+def commit_stock(lines):
+    """
+    Take ``lines`` ({product_id: qty}) out of stock, all or nothing.
+
+    Each line is decremented only if ``stock_quantity >= qty`` at that
+    moment, and only the stock columns are written, so concurrent edits to
+    other product fields survive. If any line does not fit, nothing is
+    decremented and InsufficientStock is raised with the failed product ids.
+    """
+    lines = {int(pid): int(qty) for pid, qty in sorted(lines.items(), key=lambda line: int(line[0])) if int(qty) > 0}
+    if not lines:
+        return
+
+    with transaction.atomic():
+        # The multi-row UPDATE locks rows in plan order: take the locks in id
+        # order first, so orders with overlapping products cannot deadlock
+        _lock_product_rows(lines)
+
+        if connection.vendor == "postgresql":
+            committed = _commit_stock_postgresql(lines)
+        else:
+            committed = _commit_stock_generic(lines)
+
+        failed = sorted(set(lines) - committed)
+        if failed:
+            names = ", ".join(Product.objects.filter(id__in=failed).values_list("product_name", flat=True)) or "unknown product"
+            raise InsufficientStock(f"Insufficient stock for {names}", failed)
+
+        # Queryset updates send no post_save: refresh the affected product cards here
+        schedule_card_refresh(list(lines))
+
+
+# ---------------------------------------------------------------
+# Expiry sweeper
+# ---------------------------------------------------------------
+def _sweep_batches(queryset, batch_size, apply):
+    """
+    Apply ``apply(batch)`` to ``queryset`` in batches of ids, one short
+    transaction each. ``batch`` keeps the queryset's filter, so a hold
+    renewed since it was selected is left alone.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += apply(queryset.order_by().filter(id__in=ids))
+
+
+def _delete_batch(batch):
+    """
+    One plain DELETE for the rows of ``batch`` (its filter included), without
+    the per-row fetch and signals of QuerySet.delete(). Returns the row count.
+    """
+    table = connection.ops.quote_name(batch.model._meta.db_table)
+    pk = connection.ops.quote_name(batch.model._meta.pk.column)
+    select_sql, params = batch.values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({select_sql})", params)
+        return cursor.rowcount
+
+
+def sweep_expired_reservations(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """
+    Delete expired ProductReservation rows and clear expired legacy
+    Product.reserved_by / reserved_until holds. Returns (holds, legacy_holds).
+
+    Expired holds no longer count anywhere and product cards already expire
+    with their soonest hold, so rows are removed without per-row signals.
+    """
+    now = now or timezone.now()
+
+    holds = _sweep_batches(
+        ProductReservation.objects.filter(reserved_until__lte=now).order_by("reserved_until"),
+        batch_size,
+        _delete_batch,
+    )
+
+    legacy_holds = _sweep_batches(
+        Product.objects.filter(reserved_until__lte=now).order_by("reserved_until"),
+        batch_size,
+        lambda batch: batch.update(reserved_by=None, reserved_until=None),
+    )
+
+    return holds, legacy_holds
+
+
+def run_reservation_sweep():
+    """Scheduler task: sweep now, then wait for the runner's interval."""
+    sweep_expired_reservations()
+    return None
@@ -0,0 +1,468 @@
+"""
+Address label PDFs (four A6 labels per A4 page).
+
+Orders are read in chunks with their lines and products prefetched, so a
+batch costs two queries per chunk whatever its size. Product-cell heights
+are measured once per (text, width) and cached for the process. Output
+goes to a spooled temporary file, which the view streams back.
+
+A reportlab canvas keeps every page it drew until save(), so big batches
+are drawn as several documents of LABEL_PART_PAGES pages each. The parts
+are appended to the output page by page (PdfAppender), so memory is bound
+by one part whatever the batch size.
+"""
+import math
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import Prefetch
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+from .models import OrderDetails, OrderItem
+from .utils import extract_location_details
+
+# Labels above this size are spooled to disk instead of memory
+LABEL_SPOOL_MAX_SIZE = getattr(settings, "LABEL_SPOOL_MAX_SIZE", 8 * 1024 * 1024)
+LABEL_CHUNK_SIZE = 500
+# Pages drawn per canvas before it is saved and a new one started (4 labels per page)
+LABEL_PART_PAGES = getattr(settings, "LABEL_PART_PAGES", 250)
+
+COMPANY = {
+    "name": "Vallalar Naturals from Village Kannama",
+    "address": "Vadalur - 607303.",
+    "phone": "+91 7639157615",
+}
+
+WRAP_STYLE = ParagraphStyle(name="wrap_style", fontName="Helvetica", fontSize=9, leading=10)
+NORMAL_STYLE = ParagraphStyle(name="Normal", fontName="Helvetica", fontSize=11, leading=14)
+BOLD_STYLE = ParagraphStyle(name="BodyText", fontName="Helvetica-Bold", fontSize=13, leading=16)
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 0.3, colors.black),
+])
+
+PAGE_W, PAGE_H = A4
+BLOCK_W = 105 * mm
+BLOCK_H = 148.5 * mm
+POSITIONS = [
+    (0, BLOCK_H), (BLOCK_W, BLOCK_H),
+    (0, 0), (BLOCK_W, 0)
+]
+
+BLOCK_WITH_HEADER_MAX = 4
+BLOCK_TABLE_ONLY_MAX = 20
+PRODUCT_COL_PADDING = 15 * mm
+
+
+@lru_cache(maxsize=4096)
+def paragraph_lines_count(text, col_w):
+    """Wrapped line count of a product cell; product names repeat, so measure each once."""
+    p = Paragraph(text, WRAP_STYLE)
+    p.wrap(col_w, 9999)
+    return max(1, math.ceil(p.height / WRAP_STYLE.leading))
+
+
+def label_product_name(product):
+    qty_clean = str(product.quantity).rstrip("0").rstrip(".")
+    unit = product.quantity_unit or ""
+    clean_name = product.product_name.replace("_", " ").title()
+    return f"{clean_name} ({qty_clean} {unit})" if unit else clean_name
+
+
+def label_orders(order_ids):
+    """Orders to label, with everything drawn on the label prefetched."""
+    return (
+        OrderDetails.objects.filter(id__in=order_ids)
+        .only(
+            "id", "first_name", "last_name", "shipping_address", "contact_number",
+            "order_number", "preferred_courier_service", "created_at",
+        )
+        .prefetch_related(
+            Prefetch(
+                "items",
+                queryset=OrderItem.objects.select_related("product").only(
+                    "id", "order_id", "quantity",
+                    "product__id", "product__product_name", "product__quantity", "product__quantity_unit",
+                ),
+            )
+        )
+    )
+
+
+def parse_order(o):
+    loc = extract_location_details(o.shipping_address)
+    return {
+        "name": f"{o.first_name or ''} {o.last_name or ''}",
+        "address": o.shipping_address or "",
+        "district": loc.get("district", ""),
+        "pincode": loc.get("pincode", ""),
+        "phone": o.contact_number,
+        "order_number": o.order_number,
+        "courier_service": o.preferred_courier_service,
+        "items": [
+            {"product": label_product_name(itm.product), "qty": itm.quantity}
+            for itm in o.items.all()
+        ],
+    }
+
+
+class LabelSheet:
+    """
+    Draws labels four blocks per page, starting pages as needed. After
+    ``part_pages`` pages the canvas is saved and ``new_canvas()`` gives the
+    next one, so only pages break between parts, never labels.
+    """
+
+    def __init__(self, new_canvas, part_pages=None):
+        self.new_canvas = new_canvas
+        self.part_pages = part_pages
+        self.c = new_canvas()
+        self.pages_in_part = 0
+        self.block_index = 0
+        self.order_counter = 1
+        self.first_page = True
+        self.start_page()
+
+    def draw_separators(self):
+        c = self.c
+        c.setDash(2, 2)
+        c.line(BLOCK_W, 0, BLOCK_W, PAGE_H)
+        c.line(0, BLOCK_H, PAGE_W, BLOCK_H)
+        c.setDash()
+
+    def start_page(self):
+        if not self.first_page:
+            if self.part_pages and self.pages_in_part >= self.part_pages:
+                self.c.save()
+                self.c = self.new_canvas()
+                self.pages_in_part = 0
+            else:
+                self.c.showPage()
+        self.draw_separators()
+        self.first_page = False
+        self.pages_in_part += 1
+
+    def save(self):
+        self.c.save()
+
+    def next_block(self):
+        if self.block_index >= 4:
+            self.block_index = 0
+            self.start_page()
+
+        x, y = POSITIONS[self.block_index]
+        self.c.rect(x, y, BLOCK_W, BLOCK_H)
+        return x, y
+
+    def draw_header(self, tx, ty, order):
+        avail = BLOCK_W - 20*mm  # width available inside block
+
+        def draw(text, style, reduce_mm):
+            nonlocal ty
+            p = Paragraph(text, style)
+            p.wrap(avail, 9999)      # ensure wrap happens BEFORE draw (prevents blPara error)
+            p.drawOn(self.c, tx, ty)
+            ty -= reduce_mm          # controlled spacing in mm
+
+        # ---------- FROM ----------
+        draw("<b>From:</b>", BOLD_STYLE, 5*mm)
+        draw(COMPANY["name"], NORMAL_STYLE, 6*mm)
+        draw(COMPANY["address"], NORMAL_STYLE, 6*mm)
+        draw(f"Phone: {COMPANY['phone']}", NORMAL_STYLE, 8*mm)
+
+        # ---------- TO ----------
+        draw("<b>To:</b>", BOLD_STYLE, 5*mm)
+        draw(order["name"], NORMAL_STYLE, 10*mm)
+        draw(order["address"], NORMAL_STYLE, 6*mm)
+        draw(f"District: {order['district']}", NORMAL_STYLE, 5*mm)
+        draw(f"Pincode: {order['pincode']}", NORMAL_STYLE, 5*mm)
+        draw(f"Phone: +91 {order['phone']}", NORMAL_STYLE, 10*mm)
+
+        # ---------- ORDER DETAILS ----------
+        draw(f"<b>Courier Name: {order['courier_service']}</b>", BOLD_STYLE, 8*mm)
+        draw(f"<b>Order No: {order['order_number']}</b>", BOLD_STYLE, 8*mm)
+
+        return ty
+
+    def draw_table(self, tx, ty_top, rows, avail_w):
+        col_product = avail_w - PRODUCT_COL_PADDING
+        data = [["Product", "Qty"]]
+
+        for it in rows:
+            data.append([Paragraph(it["product"], WRAP_STYLE), str(it["qty"])])
+
+        tbl = Table(data, colWidths=[col_product, PRODUCT_COL_PADDING])
+        tbl.setStyle(TABLE_STYLE)
+
+        tw, th = tbl.wrap(avail_w, 9999)
+        tbl.drawOn(self.c, tx, ty_top - th)
+        return th
+
+    def draw_footer(self, x, y, block_no):
+        self.c.setFont("Helvetica", 7)
+        self.c.drawString(x + 3*mm, y + 3*mm, f"C{self.order_counter}-{block_no}")
+
+    @staticmethod
+    def take_rows(items, max_rows, col_w):
+        taken, used = [], 0
+        while items and used < max_rows:
+            lines = paragraph_lines_count(items[0]["product"], col_w)
+            if used + lines > max_rows:
+                break
+            taken.append(items.pop(0))
+            used += lines
+        return taken
+
+    def add_order(self, order):
+        items = order["items"][:]
+        avail = BLOCK_W - 20 * mm
+        product_col_w = avail - PRODUCT_COL_PADDING
+        block_no = 1
+
+        # HEADER BLOCK
+        x, y = self.next_block()
+        tx = x + 10*mm
+        ty_after = self.draw_header(tx, y + BLOCK_H - 12*mm, order)
+
+        placed = self.take_rows(items, BLOCK_WITH_HEADER_MAX, product_col_w)
+        if placed:
+            self.draw_table(tx, ty_after, placed, avail)
+
+        self.draw_footer(x, y, block_no)
+        block_no += 1
+        self.block_index += 1
+
+        # TABLE ONLY BLOCKS
+        while items:
+            x2, y2 = self.next_block()
+            take = self.take_rows(items, BLOCK_TABLE_ONLY_MAX, product_col_w)
+            self.draw_table(x2 + 10*mm, y2 + BLOCK_H - 12*mm, take, avail)
+
+            self.draw_footer(x2, y2, block_no)
+            block_no += 1
+            self.block_index += 1
+
+        self.order_counter += 1
+
+
+class PdfAppender:
+    """
+    Writes the pages of several PDFs into ``out`` as one document. Each page
+    and the objects it uses are copied to ``out`` as soon as they are read;
+    only object offsets and page ids stay in memory (PdfWriter would keep
+    every page until write()).
+    """
+    CATALOG_ID, PAGES_ID = 1, 2
+
+    def __init__(self, out):
+        self.out = out
+        self.offsets = {}
+        self.kids = []
+        self.next_id = 3
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _write(self, obj_id, obj):
+        self.offsets[obj_id] = self.out.tell()
+        self.out.write(f"{obj_id} 0 obj\n".encode())
+        obj.write_to_stream(self.out, None)
+        self.out.write(b"\nendobj\n")
+
+    def _copy(self, obj, remap, pending):
+        """``obj`` with its references renumbered; newly seen references are queued in ``pending``."""
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in remap:
+                remap[key] = self._new_id()
+                pending.append(obj)
+            return IndirectObject(remap[key], 0, None)
+        if isinstance(obj, StreamObject):
+            copy = StreamObject()
+            copy._data = obj._data  # still encoded: copied as is
+            copy.update({k: self._copy(v, remap, pending) for k, v in obj.items()})
+            return copy
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({k: self._copy(v, remap, pending) for k, v in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(v, remap, pending) for v in obj)
+        return obj
+
+    def append(self, source):
+        reader = PdfReader(source)
+        pages_ref = reader.trailer["/Root"].raw_get("/Pages")
+        # References back to the source's page tree point at ours instead
+        remap = {(pages_ref.idnum, pages_ref.generation): self.PAGES_ID}
+        pending = []
+
+        for page in reader.pages:
+            ref = page.indirect_reference
+            page_id = remap.setdefault((ref.idnum, ref.generation), self._new_id())
+            copy = self._copy(DictionaryObject({k: v for k, v in page.items() if k != "/Parent"}), remap, pending)
+            copy[NameObject("/Parent")] = IndirectObject(self.PAGES_ID, 0, None)
+            self._write(page_id, copy)
+            self.kids.append(page_id)
+
+            while pending:
+                ref = pending.pop()
+                obj = ref.get_object()
+                self._write(remap[(ref.idnum, ref.generation)], NullObject() if obj is None else self._copy(obj, remap, pending))
+
+        # Parsed objects point back at the reader: drop them now rather than at the next full GC
+        reader.resolved_objects.clear()
+
+    def finish(self):
+        self._write(self.PAGES_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Count"): NumberObject(len(self.kids)),
+            NameObject("/Kids"): ArrayObject(IndirectObject(kid, 0, None) for kid in self.kids),
+        }))
+        self._write(self.CATALOG_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self.PAGES_ID, 0, None),
+        }))
+
+        xref_offset = self.out.tell()
+        self.out.write(f"xref\n0 {self.next_id}\n0000000000 65535 f \n".encode())
+        for obj_id in range(1, self.next_id):
+            self.out.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode())
+        self.out.write(
+            f"trailer\n<< /Size {self.next_id} /Root {self.CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+
+def _merge_parts(parts):
+    """One spooled PDF from the part files (each closed once appended), rewound."""
+    if len(parts) == 1:
+        parts[0].seek(0)
+        return parts[0]
+
+    out = SpooledTemporaryFile(max_size=LABEL_SPOOL_MAX_SIZE)
+    appender = PdfAppender(out)
+    for part in parts:
+        part.seek(0)
+        appender.append(part)
+        part.close()
+    appender.finish()
+    out.seek(0)
+    return out
+
+
+def write_address_labels(orders, chunk_size=LABEL_CHUNK_SIZE, part_pages=LABEL_PART_PAGES):
+    """
+    Draw labels for ``orders`` (a label_orders() queryset) into a spooled
+    temporary file, rewound and ready to stream.
+    """
+    parts = []
+
+    def new_canvas():
+        parts.append(SpooledTemporaryFile(max_size=LABEL_SPOOL_MAX_SIZE))
+        return canvas.Canvas(parts[-1], pagesize=A4)
+
+    sheet = LabelSheet(new_canvas, part_pages)
+    for o in orders.iterator(chunk_size=chunk_size):
+        sheet.add_order(parse_order(o))
+    sheet.save()
+
+    return _merge_parts(parts)
+
+
+# ---------------------------------------------------------------
+# Single-order label (one A4 page, overflow lines on a second page)
+# ---------------------------------------------------------------
+SINGLE_NORMAL_STYLE = ParagraphStyle(name="Normal", fontName="Helvetica", fontSize=11, leading=12)
+SINGLE_WRAP_STYLE = ParagraphStyle("wrap_style", fontName="Helvetica", fontSize=10, leading=12)
+
+SINGLE_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+])
+
+MAX_FIRST_PAGE_ROWS = 33
+SINGLE_PRODUCT_COL_W = 140 * mm
+
+
+def write_single_label(o):
+    """Draw the label of one order into a spooled temporary file, rewound."""
+    loc = extract_location_details(o.shipping_address)
+
+    # -------- COUNT WRAP ROWS --------
+    visual_rows = []
+    for item in o.items.select_related("product"):
+        p = Paragraph(label_product_name(item.product), SINGLE_WRAP_STYLE)
+        _, h = p.wrap(SINGLE_PRODUCT_COL_W, 9999)
+        lines = max(1, int(h / SINGLE_WRAP_STYLE.leading))
+        visual_rows.append({"product": p, "qty": str(item.quantity), "lines": lines})
+
+    # SPLIT INTO TWO PAGES
+    page1_rows, page2_rows = [], []
+    total = 0
+    for row in visual_rows:
+        if total + row["lines"] <= MAX_FIRST_PAGE_ROWS:
+            page1_rows.append(row)
+            total += row["lines"]
+        else:
+            page2_rows.append(row)
+
+    out = SpooledTemporaryFile(max_size=LABEL_SPOOL_MAX_SIZE)
+    c = canvas.Canvas(out, pagesize=A4)
+
+    # -------- HEADER BLOCK --------
+    tx = 15 * mm
+    ty = PAGE_H - 15 * mm
+
+    def write(text, style, reduce):
+        nonlocal ty
+        p = Paragraph(text, style)
+        p.wrap(PAGE_W - 30 * mm, 9999)
+        p.drawOn(c, tx, ty)
+        ty -= reduce
+
+    write("<b>From:</b>", BOLD_STYLE, 5*mm)
+    write(COMPANY["name"], SINGLE_NORMAL_STYLE, 6*mm)
+    write(COMPANY["address"], SINGLE_NORMAL_STYLE, 6*mm)
+    write(f"Phone: {COMPANY['phone']}", SINGLE_NORMAL_STYLE, 8*mm)
+
+    write("<b>To:</b>", BOLD_STYLE, 5*mm)
+    write(f"{o.first_name} {o.last_name}", SINGLE_NORMAL_STYLE, 6*mm)
+    write(o.shipping_address, SINGLE_NORMAL_STYLE, 6*mm)
+    write(f"District: {loc['district']}", SINGLE_NORMAL_STYLE, 5*mm)
+    write(f"Pincode: {loc['pincode']}", SINGLE_NORMAL_STYLE, 5*mm)
+    write(f"Phone: +91 {o.contact_number}", SINGLE_NORMAL_STYLE, 10*mm)
+
+    write(f"<b>Order No: {o.order_number}</b>", BOLD_STYLE, 10*mm)
+    write(f"<b>Courier Name: {o.preferred_courier_service}</b>", BOLD_STYLE, 10*mm)
+
+    def product_table(rows):
+        table = Table([["Product", "Qty"]] + [[r["product"], r["qty"]] for r in rows], colWidths=[140*mm, 40*mm])
+        table.setStyle(SINGLE_TABLE_STYLE)
+        return table, table.wrap(PAGE_W - 30*mm, 9999)[1]
+
+    # -------- PAGE 1 --------
+    table, th = product_table(page1_rows)
+    table.drawOn(c, tx, ty - th)
+
+    # -------- PAGE 2 --------
+    if page2_rows:
+        c.showPage()
+        table2, th2 = product_table(page2_rows)
+        table2.drawOn(c, 15*mm, PAGE_H - 30*mm - th2)
+
+    c.save()
+    out.seek(0)
+    return out
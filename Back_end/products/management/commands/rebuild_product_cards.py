@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.cards import refresh_product_cards
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed product cards used by the product list endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        ids = list(Product.objects.filter(parent__isnull=True).order_by("id").values_list("id", flat=True))
+
+        for start in range(0, len(ids), batch_size):
+            refresh_product_cards(ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(ids)} product cards."))
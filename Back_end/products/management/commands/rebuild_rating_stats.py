@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.ratings import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute per-product rating stats and average_rating from the approved reviews."
+
+    def handle(self, *args, **options):
+        products = rebuild_rating_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating stats for {products} products."))
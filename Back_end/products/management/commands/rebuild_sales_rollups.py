@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups used by the admin dashboard from all orders."
+
+    def handle(self, *args, **options):
+        days, product_days = rebuild_sales_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} daily and {product_days} daily product rollups."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import is_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.search_vector for every product (PostgreSQL only)."
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            self.stdout.write(self.style.WARNING("Full-text search requires PostgreSQL; nothing to do."))
+            return
+
+        update_search_vectors(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS("Search vectors rebuilt."))
@@ -0,0 +1,23 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from products.exports import run_worker
+
+
+class Command(BaseCommand):
+    help = "Render queued PDF export jobs (invoices, address labels) in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                            help="Number of rendering processes.")
+        parser.add_argument("--poll-interval", type=float, default=2,
+                            help="Seconds to wait between checks for new jobs.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Export worker running with {options['workers']} process(es) (Ctrl+C to stop).")
+        try:
+            run_worker(workers=options["workers"], poll_interval=options["poll_interval"], once=options["once"])
+        except KeyboardInterrupt:
+            pass
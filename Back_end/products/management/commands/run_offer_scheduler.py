@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from products.offers import run_offer_sync, sync_offer_status
+from products.scheduler import PeriodicRunner
+
+
+class Command(BaseCommand):
+    help = "Activate / deactivate offers at their start and end dates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Sync offer status once and exit.")
+        parser.add_argument("--max-interval", type=int, default=300,
+                            help="Upper bound in seconds between checks (picks up edited offers).")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            changed = sync_offer_status()
+            self.stdout.write(self.style.SUCCESS(f"Updated {changed} offer(s)."))
+            return
+
+        runner = PeriodicRunner(
+            "offer-scheduler", run_offer_sync, max_interval=options["max_interval"], single_instance=True
+        )
+        self.stdout.write("Offer scheduler running (Ctrl+C to stop).")
+        try:
+            runner.run()
+        except KeyboardInterrupt:
+            runner.stop()
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.inventory import SWEEP_BATCH_SIZE, run_reservation_sweep, sweep_expired_reservations
+from products.scheduler import PeriodicRunner
+
+
+class Command(BaseCommand):
+    help = "Purge expired stock reservations (checkout holds and legacy product holds)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Sweep once and exit.")
+        parser.add_argument("--interval", type=int, default=getattr(settings, "RESERVATION_SWEEP_INTERVAL", 60),
+                            help="Seconds between sweeps.")
+        parser.add_argument("--batch-size", type=int, default=SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            holds, legacy_holds = sweep_expired_reservations(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Removed {holds} expired reservation(s), cleared {legacy_holds} legacy hold(s)."
+            ))
+            return
+
+        runner = PeriodicRunner(
+            "reservation-sweeper", run_reservation_sweep, max_interval=options["interval"], single_instance=True
+        )
+        self.stdout.write("Reservation sweeper running (Ctrl+C to stop).")
+        try:
+            runner.run()
+        except KeyboardInterrupt:
+            runner.stop()
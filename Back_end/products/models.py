@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from auth_model.models import AdminDetails,CustomerDetails
 from django.utils.translation import gettext_lazy as _
 import uuid
 from django.utils import timezone
 from datetime import date
-from django.db.models import Avg,Sum
+from django.db.models import Avg,Sum,F,OuterRef,Subquery,IntegerField
+from django.db.models.functions import Coalesce, Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 
 
 
@@ -28,7 +32,73 @@ class Category(models.Model):
         return self.name
 
 
-class Product(models.Model):
+class ProductQuerySet(models.QuerySet):
+
+    def with_available_stock(self, for_user=None):
+        """
+        Annotate ``reserved_qty`` (active holds) and ``available_qty``
+        (stock_quantity - reserved_qty) for every row in one subquery,
+        excluding ``for_user``'s own holds like Product.available_stock().
+        """
+        holds = ProductReservation.objects.filter(product=OuterRef("pk"), reserved_until__gt=timezone.now())
+        if for_user:
+            holds = holds.exclude(user=for_user)
+
+        reserved = holds.order_by().values("product").annotate(total=Sum("quantity")).values("total")
+
+        return self.annotate(
+            reserved_qty=Coalesce(Subquery(reserved, output_field=IntegerField()), 0),
+            available_qty=F("stock_quantity") - F("reserved_qty"),
+        )
+
+
+class TrackedFieldsMixin:
+    """
+    Remembers the values ``tracked_fields`` had when the row was loaded, so
+    save() and signal receivers can tell what changed without re-reading it.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.reset_tracking()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            self.reset_tracking()
+        else:
+            original = self.__dict__.setdefault("_original", {})
+            original.update({f: self.__dict__[f] for f in fields if f in self.tracked_fields})
+
+    def reset_tracking(self):
+        # Deferred fields are left out and looked up on first use
+        self._original = {f: self.__dict__[f] for f in self.tracked_fields if f in self.__dict__}
+
+    def get_original(self, field):
+        """Value of ``field`` as last loaded or saved (None for unsaved rows)."""
+        if self.pk is None:
+            return None
+        original = self.__dict__.setdefault("_original", {})
+        if field not in original:
+            original[field] = type(self)._base_manager.filter(pk=self.pk).values_list(field, flat=True).first()
+        return original[field]
+
+    def has_changed(self, field):
+        if self.pk is None:
+            return True
+        # Still deferred: never loaded, so never assigned either
+        if field not in self.__dict__:
+            return False
+        return self.get_original(field) != getattr(self, field)
+
+
+class Product(TrackedFieldsMixin, models.Model):
+    # Compared in post_save receivers (products/signals.py)
+    tracked_fields = ("product_name", "product_description", "category_id", "parent_id")
+
     product_name = models.CharField(max_length=300, blank=False, null=False)
     product_description = models.TextField(max_length=3000, blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -49,14 +119,26 @@ class Product(models.Model):
 
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
 
+    # Maintained by products/search.py (name, category name, description)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
     created_by = models.ForeignKey(AdminDetails,on_delete=models.CASCADE, related_name='product',null=True,blank=True)
     updated_by = models.ForeignKey(AdminDetails,on_delete=models.CASCADE, related_name='update_product',null=True,blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         db_table = "products_details"
         ordering = ["-created_at"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_vector_gin"),
+            GinIndex(fields=["product_name"], name="product_name_trgm_gin", opclasses=["gin_trgm_ops"]),
+            # Reservation sweeper (products/inventory.py): legacy holds only
+            models.Index(fields=["reserved_until"], name="product_reserved_until_idx",
+                         condition=models.Q(reserved_until__isnull=False)),
+        ]
 
     def is_reserved(self):
         """Check if reservation is still active"""
@@ -75,9 +157,7 @@ class Product(models.Model):
         ).delete()
     
     def available_stock(self, for_user=None):
-    # Clear expired reservations
-        self.clear_expired_reservations()
-
+        # Expired holds are ignored here and purged by the reservation sweeper
         # Total reserved by other users only
         qs = ProductReservation.objects.filter(
             product=self,
@@ -107,8 +187,19 @@ class Product(models.Model):
         else:
             self.is_available = True
         super().save(*args, **kwargs)
+        self.reset_tracking()
+
+# Sent after an order's status changed (OrderDetails.save or orders.bulk_set_status)
+order_status_changed = Signal()  # kwargs: order, previous, notified (True when the notifications are already queued)
+
+
+class InvalidStatusTransition(ValueError):
+    pass
 
-class OrderDetails(models.Model):
+
+class OrderDetails(TrackedFieldsMixin, models.Model):
+
+    tracked_fields = ("status", "payment_status", "total_amount")
 
     class OrderStatus(models.TextChoices):
         PENDING = "pending", _("Pending")
@@ -159,43 +250,97 @@ class OrderDetails(models.Model):
 
     is_printed = models.BooleanField(default=False)
 
+    # Whether this order's amounts are included in the sales rollups (products/rollups.py)
+    counted_in_sales = models.BooleanField(default=False, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def can_change_status(self, new_status):
+        old_status = self.get_original("status")
+        return (
+            old_status is None
+            or new_status == old_status
+            or new_status in ALLOWED_STATUS_TRANSITIONS.get(old_status, ())
+        )
+
+    def check_status_transition(self, new_status=None):
+        new_status = new_status or self.status
+        if not self.can_change_status(new_status):
+            raise InvalidStatusTransition(
+                f"Order {self.order_number} cannot go from '{self.get_original('status')}' to '{new_status}'."
+            )
+
     def save(self, *args, **kwargs):
-    # Set delivered_at when status changes to delivered
-        if self.pk:
-            old = OrderDetails.objects.get(pk=self.pk)
-            if old.status != self.status and self.status == self.OrderStatus.DELIVERED:
-                self.delivered_at = timezone.now()
-        else:
+        is_new = self.pk is None
+        deferred = self.get_deferred_fields()
+        status_changed = self.has_changed("status")
+        previous_status = self.get_original("status") if status_changed else None
+        if not is_new:
+            # Fields assigned after a deferred load have no original yet: resolve
+            # them now, post_save receivers compare against them
+            for field in self.tracked_fields:
+                if field in self.__dict__:
+                    self.get_original(field)
+
+        if status_changed:
+            self.check_status_transition()
+            # Set delivered_at when status changes to delivered
             if self.status == self.OrderStatus.DELIVERED:
                 self.delivered_at = timezone.now()
 
-        # Generate ORDER NUMBER (only first time)
-        if not self.order_number:
-            import random
-            from datetime import datetime
+        # Generate ORDER NUMBER (only first time; a deferred one was already stored)
+        if "order_number" not in deferred and not self.order_number:
+            from .order_numbers import next_order_number
+            self.order_number = next_order_number()
 
-            today = datetime.now().strftime("%Y%m%d")   # YYYYMMDD
-            unique = False
-
-            while not unique:
-                random_part = str(random.randint(100000, 999999))  # 6-digit random
-                generated = f"ORD-{today}-{random_part}"
-
-                if not OrderDetails.objects.filter(order_number=generated).exists():
-                    unique = True
-                    self.order_number = generated
+        # counted_in_sales belongs to products/rollups.py: never write it back from a (possibly stale) instance.
+        # Deferred fields stay out too, as in Django's own save(), instead of being loaded one query each.
+        if not is_new and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "counted_in_sales" and f.attname not in deferred
+            ]
 
         super().save(*args, **kwargs)
 
+        if status_changed and not is_new:
+            order_status_changed.send(sender=OrderDetails, order=self, previous=previous_status)
+        self.reset_tracking()
+
     def __str__(self):
         return f"Order {self.order_number} - {self.customer.full_name}"
 
     class Meta:
         db_table = "order_details"
         ordering = ["-created_at"]
+        indexes = [
+            # Order search (products/search.py): prefix lookups, status filters, amount ranges, keyset paging.
+            # order_number prefixes use the varchar_pattern_ops "_like" index Django creates for unique=True.
+            models.Index(OpClass(Upper("courier_number"), name="text_pattern_ops"), name="order_courier_prefix_idx"),
+            models.Index(OpClass(Upper("preferred_courier_service"), name="text_pattern_ops"), name="order_courier_name_prefix_idx"),
+            models.Index(fields=["status", "-created_at"], name="order_status_created_idx"),
+            models.Index(fields=["payment_status", "-created_at"], name="order_payment_created_idx"),
+            models.Index(fields=["total_amount"], name="order_total_amount_idx"),
+            models.Index(fields=["-created_at", "-id"], name="order_created_id_idx"),
+        ]
+
+
+ALLOWED_STATUS_TRANSITIONS = {
+    OrderDetails.OrderStatus.PENDING: {
+        OrderDetails.OrderStatus.ORDER_CONFIRMED, OrderDetails.OrderStatus.SHIPPED,
+        OrderDetails.OrderStatus.DELIVERED, OrderDetails.OrderStatus.CANCELLED,
+    },
+    OrderDetails.OrderStatus.ORDER_CONFIRMED: {
+        OrderDetails.OrderStatus.SHIPPED, OrderDetails.OrderStatus.DELIVERED, OrderDetails.OrderStatus.CANCELLED,
+    },
+    OrderDetails.OrderStatus.SHIPPED: {
+        OrderDetails.OrderStatus.DELIVERED, OrderDetails.OrderStatus.RETURNED, OrderDetails.OrderStatus.CANCELLED,
+    },
+    OrderDetails.OrderStatus.DELIVERED: {OrderDetails.OrderStatus.RETURNED},
+    OrderDetails.OrderStatus.CANCELLED: set(),
+    OrderDetails.OrderStatus.RETURNED: set(),
+}
 
 
 class OrderItem(models.Model):
@@ -224,6 +369,10 @@ class Invoice(models.Model):
     invoice_number = models.CharField(max_length=20, unique=True, editable=False)
     generated_at = models.DateTimeField(auto_now_add=True)
 
+    # Last rendered PDF and the hash of the content printed on it (products/pdf.py)
+    pdf = models.FileField(upload_to="invoices/", blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -280,11 +429,21 @@ class OfferDetails(models.Model):
     def __str__(self):
         return f"{self.offer_name} - {self.offer_percentage}%"
 
-    # ✅ Automatically deactivate expired offers
+    def applies_on(self, today):
+        """Whether this offer discounts prices on ``today`` (product cards and ProductWithOfferSerializer)."""
+        if not self.is_active or not self.offer_percentage:
+            return False
+        if self.start_date and self.end_date:
+            return self.start_date <= today <= self.end_date
+        return True
+
+    # ✅ Bring is_active in line with today's date (same rules as the offer scheduler)
     def check_and_update_status(self):
-        today = timezone.now().date()
-        if self.end_date < today and self.is_active:
-            self.is_active = False
+        from .offers import offer_status_for
+
+        is_active = offer_status_for(self, timezone.now().date())
+        if is_active != self.is_active:
+            self.is_active = is_active
             self.save(update_fields=['is_active'])
 
 class FavoriteProduct(models.Model):
@@ -296,11 +455,18 @@ class FavoriteProduct(models.Model):
     class Meta:
         db_table = 'favorite_details'
         ordering = ['-created_at']
+        indexes = [
+            # Favorite flags for a page of products (products/favorites.py)
+            models.Index(fields=["customer", "product"], name="favorite_customer_product_idx"),
+        ]
 
     def __str__(self):
         return f"{self.customer} - {self.product}"
     
 class ProductFeedback(models.Model):
+
+    rating_fields = ("product_id", "rating", "is_approved")
+
     product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="feedbacks")
     user = models.ForeignKey("auth_model.CustomerDetails", on_delete=models.CASCADE, related_name="product_feedbacks")
     rating = models.PositiveSmallIntegerField(default=5)  
@@ -318,20 +484,49 @@ class ProductFeedback(models.Model):
     def __str__(self):
         return f"{self.product.product_name} - {self.rating}⭐ by {self.user}"
 
+    def _lock_stored_rating(self):
+        """Lock the stored row and return its (product_id, rating, is_approved), or None if there is none."""
+        if self.pk is None:
+            return None
+        return ProductFeedback.objects.select_for_update().filter(pk=self.pk).values_list(*self.rating_fields).first()
+
     def save(self, *args, **kwargs):
+        from .ratings import apply_rating_change
+
+        with transaction.atomic():
+            # Read under the row lock: a concurrent edit cannot be counted twice
+            before = self._lock_stored_rating()
+            super().save(*args, **kwargs)
+            # Only the (product, rating, approval) delta touches the stats row
+            apply_rating_change(before, (self.product_id, self.rating, self.is_approved))
+
+    # Deletes (cascades included) are counted by the pre/post_delete receivers in products/signals.py
+
+
+class ProductRatingStats(models.Model):
+    """Approved-review counts per star for a product, kept by products/ratings.py."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="rating_stats")
+    stars_1 = models.IntegerField(default=0)
+    stars_2 = models.IntegerField(default=0)
+    stars_3 = models.IntegerField(default=0)
+    stars_4 = models.IntegerField(default=0)
+    stars_5 = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    approved_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
-        super().save(*args, **kwargs)
+    class Meta:
+        db_table = "product_rating_stats"
 
-        self.update_product_rating()
+    def __str__(self):
+        return f"{self.product_id}: {self.approved_count} ratings"
 
-    def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
-        self.update_product_rating()
+    @property
+    def average(self):
+        return self.rating_sum / self.approved_count if self.approved_count else 0
 
-    def update_product_rating(self):
-        avg_rating = self.product.feedbacks.aggregate(avg=Avg("rating"))["avg"] or 0.0
-        self.product.average_rating = round(avg_rating, 2)
-        self.product.save(update_fields=["average_rating"])
+    def star_counts(self):
+        return {str(star): getattr(self, f"stars_{star}") for star in range(1, 6)}
 
 
 class Notification(models.Model):
@@ -360,14 +555,30 @@ class Notification(models.Model):
     class Meta:
         db_table = "notification_details"
         ordering = ["-created_at"]
+        indexes = [
+            # Customer feed, newest first (keyset on created_at, id)
+            models.Index(fields=["customer", "-created_at", "-id"], name="notif_customer_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.type})"
 
     def mark_as_read(self):
-        self.is_read = True
-        self.read_at = timezone.now()
-        self.save(update_fields=["is_read", "read_at"])
+        from .notifications import mark_read
+        mark_read(self)
+
+
+class NotificationSummary(models.Model):
+    """Per-customer unread notification count, kept by products/notifications.py."""
+    customer = models.OneToOneField("auth_model.CustomerDetails", on_delete=models.CASCADE, primary_key=True, related_name="notification_summary")
+    unread_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "notification_summary"
+
+    def __str__(self):
+        return f"{self.customer_id}: {self.unread_count} unread"
 
 
 class ProductReservation(models.Model):
@@ -380,3 +591,114 @@ class ProductReservation(models.Model):
 
     class Meta:
         unique_together = ("user", "product")     # one reservation per user-product
+        indexes = [
+            # Expiry sweep and active-hold lookups
+            models.Index(fields=["reserved_until"], name="reservation_until_idx"),
+        ]
+
+
+class ProductCard(models.Model):
+    """Denormalized listing row for a parent product (see products/cards.py)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="card")
+    display_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    active_variant = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+
+    offer_percentage = models.PositiveIntegerField(null=True, blank=True)
+    offer_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    active_variant_offer_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    available_stock = models.IntegerField(default=0)
+
+    # Next moment the resolution can change without a write (offer date
+    # boundary or reservation expiry); stale cards are refreshed on read.
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "product_cards"
+
+    def __str__(self):
+        return f"Card for {self.product_id} -> {self.display_product_id}"
+
+
+class DailySalesRollup(models.Model):
+    """Per-day totals of counted orders (see products/rollups.py)."""
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "daily_sales_rollup"
+        ordering = ["-date"]
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} orders, {self.total_sales}"
+
+
+class DailyProductSalesRollup(models.Model):
+    """Per-day, per-product units and revenue of counted orders."""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "daily_product_sales_rollup"
+        unique_together = ("date", "product")
+        ordering = ["-date"]
+
+    def __str__(self):
+        return f"{self.date}: {self.product_id} x {self.units}"
+
+
+class OrderNumberSequence(models.Model):
+    """Last order number handed out per day (products/order_numbers.py)."""
+    date = models.DateField(primary_key=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "order_number_sequence"
+
+    def __str__(self):
+        return f"{self.date}: {self.last_value}"
+
+
+class ExportJob(models.Model):
+    """A PDF export run by `manage.py run_export_worker` (products/exports.py)."""
+
+    class Kind(models.TextChoices):
+        INVOICE = "invoice", _("Invoice")
+        ADDRESS_LABELS = "address_labels", _("Address Labels")
+        SINGLE_LABEL = "single_label", _("Single Address Label")
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", _("Queued")
+        RUNNING = "running", _("Running")
+        DONE = "done", _("Done")
+        FAILED = "failed", _("Failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30, choices=Kind.choices)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+
+    result = models.FileField(upload_to="exports/", blank=True, null=True)
+    filename = models.CharField(max_length=255, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed while a worker renders the job; a stale one means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "export_jobs"
+        ordering = ["-created_at"]
+        indexes = [
+            # Worker claim query: oldest queued jobs first
+            models.Index(fields=["status", "created_at"], name="export_job_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} export {self.id} ({self.status})"
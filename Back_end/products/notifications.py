@@ -0,0 +1,177 @@
+"""
+Customer notification writer.
+
+Order status notifications (and the "rate your product" ones sent when an
+order is delivered) are built in memory and inserted with one bulk_create
+after the order's transaction commits, so writing them never holds the
+order row lock.
+
+Each customer's unread count lives in NotificationSummary and is adjusted
+by every write below (create, mark read, mark all read, delete, clear), so
+polling the feed never counts rows. A missing summary is built from one
+COUNT the first time it is needed.
+"""
+from collections import Counter
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from auth_model.models import CustomerDetails
+
+from .models import Notification, NotificationSummary, OrderDetails, OrderItem
+from .push import publish_notifications
+
+
+def clean_label(text: str) -> str:
+    """Convert snake_case to 'Title Case' with spaces."""
+    return text.replace("_", " ").title()
+
+
+def build_status_notifications(orders):
+    """
+    Notifications for ``orders`` ((order_id, customer_id, order_number, status)
+    tuples): one status update each, plus one rating request per line of
+    the delivered ones, with every line read in a single query.
+    """
+    delivered = [order_id for order_id, _, _, status in orders if status == OrderDetails.OrderStatus.DELIVERED]
+    lines = (
+        OrderItem.objects.filter(order_id__in=delivered)
+        .select_related("product")
+        .only("id", "order_id", "product__id", "product__product_name")
+        .order_by("order_id", "id")
+        if delivered else []
+    )
+    lines_by_order = {}
+    for item in lines:
+        lines_by_order.setdefault(item.order_id, []).append(item)
+
+    notifications = []
+    for order_id, customer_id, order_number, status in orders:
+        # 1️⃣ Normal status update notification
+        notifications.append(Notification(
+            customer_id=customer_id,
+            order_id=order_id,
+            type=Notification.NotificationType.ORDER_STATUS,
+            title="Order Status Updated",
+            message=f"Your order {order_number} is now '{clean_label(status)}'.",
+        ))
+
+        # 2️⃣ Delivered → product rating notifications
+        for item in lines_by_order.get(order_id, ()):
+            notifications.append(Notification(
+                customer_id=customer_id,
+                order_id=order_id,
+                product_id=item.product_id,
+                type=Notification.NotificationType.PRODUCT_RATING,
+                title="Rate Your Product",
+                message=f"Please rate your experience with '{clean_label(item.product.product_name)}'.",
+            ))
+
+    return notifications
+
+
+def write_status_notifications(orders):
+    return create_notifications(build_status_notifications(orders))
+
+
+def notify_status_change(orders):
+    """
+    Queue status notifications for ``orders`` (OrderDetails instances) until
+    the current transaction commits. Status and number are captured now, so
+    later changes to the instances do not leak into the messages.
+    """
+    snapshot = [(order.pk, order.customer_id, order.order_number, order.status) for order in orders]
+    if snapshot:
+        transaction.on_commit(partial(write_status_notifications, snapshot))
+
+
+# ---------------------------------------------------------------
+# Unread counter
+# ---------------------------------------------------------------
+def refresh_unread_count(customer_id):
+    """Recount ``customer_id``'s unread notifications into their summary row."""
+    count = Notification.objects.filter(customer_id=customer_id, is_read=False).count()
+    _set_unread_count(customer_id, count)
+    return count
+
+
+def refresh_unread_count_after_order_delete(customer_id):
+    """Recount after an order delete, unless the customer went with it (customer delete cascade)."""
+    if CustomerDetails.objects.filter(pk=customer_id).exists():
+        refresh_unread_count(customer_id)
+
+
+def _set_unread_count(customer_id, count):
+    NotificationSummary.objects.bulk_create(
+        [NotificationSummary(customer_id=customer_id, unread_count=count)],
+        update_conflicts=True,
+        unique_fields=["customer"],
+        update_fields=["unread_count", "updated_at"],
+    )
+
+
+def _adjust_unread_count(deltas):
+    """Apply {customer_id: delta}; customers without a summary yet get a full recount."""
+    for customer_id, delta in deltas.items():
+        if not delta:
+            continue
+        updated = NotificationSummary.objects.filter(customer_id=customer_id).update(
+            unread_count=F("unread_count") + delta, updated_at=timezone.now()
+        )
+        if not updated:
+            refresh_unread_count(customer_id)
+
+
+def unread_count(customer_id):
+    summary = NotificationSummary.objects.filter(customer_id=customer_id).values_list("unread_count", flat=True).first()
+    if summary is None:
+        return refresh_unread_count(customer_id)
+    return summary
+
+
+# ---------------------------------------------------------------
+# Writes
+# ---------------------------------------------------------------
+def create_notifications(notifications):
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications)
+        _adjust_unread_count(Counter(n.customer_id for n in created if not n.is_read))
+        # Wake the customers' open streams (products/push.py)
+        customer_ids = {n.customer_id for n in created}
+        if customer_ids:
+            transaction.on_commit(partial(publish_notifications, customer_ids))
+    return created
+
+
+def mark_read(notification):
+    with transaction.atomic():
+        now = timezone.now()
+        changed = Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True, read_at=now)
+        if changed:
+            _adjust_unread_count({notification.customer_id: -1})
+    notification.is_read = True
+    notification.read_at = notification.read_at or now
+
+
+def mark_all_read(customer_id):
+    with transaction.atomic():
+        Notification.objects.filter(customer_id=customer_id, is_read=False).update(is_read=True, read_at=timezone.now())
+        _set_unread_count(customer_id, 0)
+
+
+def delete_notification(notification):
+    with transaction.atomic():
+        # Read state as stored, not as on the (possibly stale) instance
+        unread_deleted, _ = Notification.objects.filter(pk=notification.pk, is_read=False).delete()
+        if unread_deleted:
+            _adjust_unread_count({notification.customer_id: -unread_deleted})
+        else:
+            Notification.objects.filter(pk=notification.pk).delete()
+
+
+def clear_notifications(customer_id):
+    with transaction.atomic():
+        Notification.objects.filter(customer_id=customer_id).delete()
+        _set_unread_count(customer_id, 0)
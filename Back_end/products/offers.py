@@ -0,0 +1,157 @@
+"""
+Process-local index of currently active offers, keyed by product id.
+
+Built lazily from one query on first use, rebuilt when the date rolls over
+(offer windows are whole days), and invalidated from the OfferDetails
+post_save / post_delete receivers in products/signals.py. Other worker
+processes pick up changes after OFFER_INDEX_TTL seconds at the latest.
+"""
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .cards import schedule_card_refresh
+from .models import OfferDetails
+
+
+class ActiveOfferIndex:
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_product = None
+        self._by_category = None
+        self._day = None
+        self._built_at = 0.0
+
+    def _get_ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return getattr(settings, "OFFER_INDEX_TTL", 60)
+
+    def _is_fresh(self, today):
+        return (
+            self._by_product is not None
+            and self._day == today
+            and time.monotonic() - self._built_at < self._get_ttl()
+        )
+
+    def _build(self, today):
+        offers = (
+            OfferDetails.objects.filter(
+                is_active=True,
+                start_date__lte=today,
+                end_date__gte=today,
+            )
+            .exclude(Q(offer_percentage__isnull=True) | Q(offer_percentage=0))
+            .only("id", "product_id", "category_id", "offer_name", "offer_percentage", "start_date", "end_date", "is_active")
+            .order_by("-created_at")
+        )
+
+        by_product, by_category = {}, {}
+        for offer in offers:
+            # Newest offer wins, like iterating product.offers.all()
+            by_product.setdefault(offer.product_id, offer)
+            by_category.setdefault(offer.category_id, set()).add(offer.product_id)
+
+        self._by_product = by_product
+        self._by_category = by_category
+        self._day = today
+        self._built_at = time.monotonic()
+
+    def _ensure(self):
+        today = timezone.now().date()
+        with self._lock:
+            if not self._is_fresh(today):
+                self._build(today)
+            return self._by_product, self._by_category
+
+    def get(self, product_id):
+        """Active offer of a product, or None."""
+        by_product, _ = self._ensure()
+        return by_product.get(product_id)
+
+    def product_ids(self, category_id=None):
+        """Ids of products with an active offer (optionally of one offer category)."""
+        by_product, by_category = self._ensure()
+        if category_id is None:
+            return set(by_product)
+        return set(by_category.get(int(category_id), ()))
+
+    def invalidate(self):
+        with self._lock:
+            self._by_product = None
+            self._by_category = None
+
+
+active_offers = ActiveOfferIndex()
+
+
+# ---------------------------------------------------------------
+# Offer activation engine
+#
+# is_active follows the offer window: offers are switched on when their
+# start_date arrives and off once end_date has passed. Run it with
+# `manage.py run_offer_scheduler` (or OFFER_SCHEDULER_IN_PROCESS = True in
+# the server processes); it sleeps until the next start/end boundary, and
+# only one scheduler runs at a time.
+# ---------------------------------------------------------------
+def offer_status_for(offer, today):
+    """is_active value an offer should have on ``today``."""
+    if offer.end_date < today:
+        return False
+    if offer.start_date <= today:
+        return True
+    return offer.is_active  # not started yet: left as configured
+
+
+def sync_offer_status(today=None):
+    """Apply offer_status_for() to every offer in two set-based UPDATEs."""
+    today = today or timezone.now().date()
+
+    with transaction.atomic():
+        expired = OfferDetails.objects.filter(end_date__lt=today, is_active=True)
+        started = OfferDetails.objects.filter(start_date__lte=today, end_date__gte=today, is_active=False)
+
+        # Bulk updates skip post_save, so collect the affected products first
+        touched = list(expired.values_list("product_id", flat=True)) + list(started.values_list("product_id", flat=True))
+        if not touched:
+            return 0
+
+        expired.update(is_active=False, updated_at=timezone.now())
+        started.update(is_active=True, updated_at=timezone.now())
+
+        transaction.on_commit(active_offers.invalidate)
+        schedule_card_refresh(touched)
+
+    return len(touched)
+
+
+def next_offer_transition(today=None):
+    """Start (UTC midnight) of the next day on which some offer's status flips, or None."""
+    today = today or timezone.now().date()
+
+    bounds = OfferDetails.objects.aggregate(
+        next_start=Min("start_date", filter=Q(start_date__gt=today)),
+        last_day=Min("end_date", filter=Q(end_date__gte=today, is_active=True)),
+    )
+
+    candidates = [bounds["next_start"]]
+    if bounds["last_day"]:
+        candidates.append(bounds["last_day"] + timedelta(days=1))
+
+    candidates = [d for d in candidates if d]
+    if not candidates:
+        return None
+    return datetime.combine(min(candidates), dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def run_offer_sync():
+    """Scheduler task: sync now, then report when the next boundary is due."""
+    sync_offer_status()
+    return next_offer_transition()
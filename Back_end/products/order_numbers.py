@@ -0,0 +1,47 @@
+"""
+Order numbers: ORD-YYYYMMDD-NNNNNN.
+
+NNNNNN is a per-day counter kept in OrderNumberSequence. Every number is
+taken with one atomic increment of that day's row, so no existence check
+is needed and concurrent checkouts on any number of app servers never get
+the same number. The counter is zero-padded to six digits and simply
+grows wider past 999999 (order_number holds up to 20 characters).
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderNumberSequence
+
+ORDER_NUMBER_FORMAT = "ORD-{date:%Y%m%d}-{value:06d}"
+
+
+def _next_value_postgresql(date):
+    """Create-or-increment the day's row in one statement; the row lock is held until commit."""
+    table = connection.ops.quote_name(OrderNumberSequence._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS s ("date", last_value) VALUES (%s, 1)
+            ON CONFLICT ("date") DO UPDATE SET last_value = s.last_value + 1
+            RETURNING last_value
+            """,
+            [date],
+        )
+        return cursor.fetchone()[0]
+
+
+def _next_value_generic(date):
+    with transaction.atomic():
+        OrderNumberSequence.objects.get_or_create(date=date)
+        OrderNumberSequence.objects.filter(date=date).update(last_value=F("last_value") + 1)
+        return OrderNumberSequence.objects.values_list("last_value", flat=True).get(date=date)
+
+
+def next_order_number(date=None):
+    date = date or timezone.localdate()
+    if connection.vendor == "postgresql":
+        value = _next_value_postgresql(date)
+    else:
+        value = _next_value_generic(date)
+    return ORDER_NUMBER_FORMAT.format(date=date, value=value)
@@ -0,0 +1,123 @@
+"""
+Order writers.
+
+Lines are built in memory with their ``total`` filled in the way
+OrderItem.save() computes it (price * quantity), then written with one
+bulk statement per kind of change instead of one save() per line.
+
+bulk_set_status() moves many orders to a new status with one
+bulk_update, queues the notifications of all of them at once and still
+emits order_status_changed for each of them.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OrderDetails, OrderItem, order_status_changed
+from .notifications import notify_status_change
+from .rollups import sync_order_sales
+
+LINE_FIELDS = ["quantity", "price", "tax", "total"]
+
+
+def line_total(price, quantity):
+    """Same as OrderItem.save()."""
+    return price * quantity
+
+
+def build_order_line(order, product, quantity, price, tax=Decimal("0.00"), **extra):
+    return OrderItem(
+        order=order,
+        product=product,
+        quantity=quantity,
+        price=price,
+        tax=tax,
+        total=line_total(price, quantity),
+    )
+
+
+def lines_subtotal(items):
+    """Sum of price * quantity over validated item dicts."""
+    return sum((line_total(item["price"], item["quantity"]) for item in items), Decimal("0.00"))
+
+
+def create_order_lines(order, items):
+    """Insert every line of a new order in one statement. ``items`` are validated item dicts."""
+    return OrderItem.objects.bulk_create([build_order_line(order, **item) for item in items])
+
+
+def replace_order_lines(order, items):
+    """
+    Make ``order``'s lines match ``items`` with at most one DELETE, one
+    bulk UPDATE and one INSERT. Existing lines are matched to incoming
+    ones by product (in order, for repeated products); unmatched
+    existing lines are deleted.
+    """
+    existing = defaultdict(list)
+    for line in order.items.all().order_by("id"):
+        existing[line.product_id].append(line)
+
+    to_create, to_update = [], []
+    now = timezone.now()
+
+    for item in items:
+        new = build_order_line(order, **item)
+        matches = existing[new.product_id]
+        if not matches:
+            to_create.append(new)
+            continue
+
+        line = matches.pop(0)
+        if any(getattr(line, f) != getattr(new, f) for f in LINE_FIELDS):
+            for f in LINE_FIELDS:
+                setattr(line, f, getattr(new, f))
+            line.updated_at = now
+            to_update.append(line)
+
+    to_delete = [line.id for lines in existing.values() for line in lines]
+
+    if to_delete:
+        OrderItem.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        OrderItem.objects.bulk_update(to_update, LINE_FIELDS + ["updated_at"])
+    if to_create:
+        OrderItem.objects.bulk_create(to_create)
+
+
+def bulk_set_status(orders, new_status):
+    """
+    Move ``orders`` (loaded instances) to ``new_status``. Every transition is
+    checked before anything is written; raises InvalidStatusTransition.
+    Returns the orders whose status actually changed.
+    """
+    now = timezone.now()
+    changed = []
+
+    for order in orders:
+        if order.status == new_status:
+            continue
+        order.check_status_transition(new_status)
+        changed.append((order, order.status))
+
+    with transaction.atomic():
+        for order, _ in changed:
+            order.status = new_status
+            if new_status == OrderDetails.OrderStatus.DELIVERED:
+                order.delivered_at = now
+            order.updated_at = now
+
+        OrderDetails.objects.bulk_update([order for order, _ in changed], ["status", "delivered_at", "updated_at"])
+
+        # One on_commit writes every order's notifications
+        notify_status_change([order for order, _ in changed])
+
+        for order, previous in changed:
+            order_status_changed.send(sender=OrderDetails, order=order, previous=previous, notified=True)
+            order.reset_tracking()
+            # bulk_update sends no post_save: keep the sales rollups in step here
+            transaction.on_commit(partial(sync_order_sales, order.pk))
+
+    return [order for order, _ in changed]
@@ -0,0 +1,238 @@
+"""
+Invoice PDF generation.
+
+Font registration and the logo watermark are built once per process; the
+final invoice is stored on ``Invoice.pdf`` together with a hash of
+everything printed on it, so repeat downloads are served from storage and
+the PDF is only rendered again when the order (or the GST rate) changes.
+"""
+import hashlib
+import json
+import os
+from decimal import Decimal
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Prefetch, prefetch_related_objects
+from django.template.loader import render_to_string
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import registerFontFamily
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from xhtml2pdf import default, pisa
+
+from payment.settings_cache import charge_settings
+
+from .models import Invoice, OrderItem
+from .utils import amount_in_words_indian, link_callback
+
+# Bump when invoice.html or the rendering below changes, so stored PDFs are re-rendered
+INVOICE_LAYOUT_VERSION = 1
+
+A4_WIDTH, A4_HEIGHT = 595.27, 841.89
+
+# Printed when no GSTSetting row exists (pricing charges 0% in that case)
+DEFAULT_INVOICE_GST_PERCENTAGE = Decimal("18.00")
+
+LOGO_PATH = os.path.join(settings.BASE_DIR, "static", "image", "Logo.jpeg")
+FONT_PATH = os.path.join(settings.BASE_DIR, "static", "fonts", "DejaVuSans.ttf")
+
+COMPANY = {
+    "name": "Vallalar Naturals from Village Kannama",
+    "address": "No. 2, South Street, Abatharanapuram, Serakuppam Post, Vadalur - 607303.",
+    "email": "vallalarnaturalsvillagekannama@gmail.com",
+    "phone": "+91 7639157615",
+    "gstin": "33FEHPS4088N1ZP",
+    "logo_path": LOGO_PATH,
+    "font_path": FONT_PATH,
+}
+
+
+class InvoiceRenderError(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def register_invoice_fonts():
+    """Register DejaVuSans and make it xhtml2pdf's default (fixes ₹ everywhere). Once per process."""
+    pdfmetrics.registerFont(TTFont("DejaVuSans", FONT_PATH))
+    registerFontFamily(
+        "DejaVuSans",
+        normal="DejaVuSans",
+        bold="DejaVuSans",
+        italic="DejaVuSans",
+        boldItalic="DejaVuSans",
+    )
+
+    for name in (
+        "helvetica", "Times-Roman", "Courier", "Helvetica",
+        "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique",
+    ):
+        default.DEFAULT_FONT[name] = "DejaVuSans"
+
+
+@lru_cache(maxsize=None)
+def watermark_pdf():
+    """One A4 page with the transparent logo background, as PDF bytes. Built once per process."""
+    packet = BytesIO()
+    can = canvas.Canvas(packet, pagesize=(A4_WIDTH, A4_HEIGHT))
+
+    can.saveState()
+    can.setFillAlpha(0.08)  # Transparency (0.0 - 1.0)
+
+    img_width = A4_WIDTH * 0.9
+    img_height = img_width * 1.0
+    x = (A4_WIDTH - img_width) / 2
+    y = (A4_HEIGHT - img_height) / 2
+
+    can.drawImage(ImageReader(LOGO_PATH), x, y, width=img_width, height=img_height, mask="auto")
+    can.restoreState()
+    can.save()
+
+    return packet.getvalue()
+
+
+def format_product_name(name, max_length=18):
+    if not name:
+        return ""
+
+    name = name.replace("_", " ")
+    name = name.title()
+
+    result = ""
+    for word in name.split():
+        if len(result) + len(word) > max_length:
+            result += "\n" + word
+        else:
+            result += (" " + word if result else word)
+
+    return result
+
+
+def _invoice_context(invoice, order, items, gst_percentage):
+    subtotal = sum(float(item.price) * item.quantity for item in items)
+    gst_amount = subtotal * float(gst_percentage) / 100
+    shipping = float(order.shipping_cost or 0)
+    total_amount = subtotal + gst_amount + shipping
+
+    return {
+        "invoice_number": invoice.invoice_number,
+        "invoice_date": invoice.generated_at.strftime("%d-%b-%Y"),
+        "order": order,
+        "formatted_items": [
+            {
+                "name": format_product_name(item.product.product_name),
+                "qty": item.quantity,
+                "price": item.price,
+                "total": item.price * item.quantity,
+            }
+            for item in items
+        ],
+        "customer": {
+            "name": f"{order.first_name or ''} {order.last_name or ''}".strip(),
+            "shipping_address": order.shipping_address,
+            "billing_address": order.billing_address,
+            "contact": order.contact_number,
+        },
+        "company": COMPANY,
+        "subtotal": f"{subtotal:.2f}",
+        "gst_percentage": gst_percentage,
+        "gst_amount": f"{gst_amount:.2f}",
+        "shipping": f"{shipping:.2f}",
+        "total_amount": f"{total_amount:.2f}",
+        "amount_in_words": amount_in_words_indian(total_amount),
+        "payment_method": order.payment_method,
+    }
+
+
+def _content_hash(context):
+    """Hash of everything printed on the invoice (the template only sees ``context``)."""
+    order = context["order"]
+    printed = {
+        "layout": INVOICE_LAYOUT_VERSION,
+        "invoice_number": context["invoice_number"],
+        "invoice_date": context["invoice_date"],
+        "order_number": order.order_number,
+        "ordered_at": order.ordered_at.isoformat() if order.ordered_at else None,
+        "items": [
+            (item.product.product_name, item.quantity, item.price, item.total)
+            for item in order.items.all()
+        ],
+        "customer": context["customer"],
+        "gst_percentage": context["gst_percentage"],
+        "shipping": context["shipping"],
+        "payment_method": context["payment_method"],
+        "payment_status": order.payment_status,
+        "status": order.status,
+    }
+    raw = json.dumps(printed, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def render_invoice_pdf(context):
+    """Render invoice.html and lay the watermark under every page. Returns PDF bytes."""
+    register_invoice_fonts()
+
+    html = render_to_string("invoice.html", context)
+
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=pdf_buffer, link_callback=link_callback, encoding="UTF-8")
+    if pisa_status.err:
+        raise InvoiceRenderError("Error generating PDF")
+
+    pdf_buffer.seek(0)
+    reader = PdfReader(pdf_buffer)
+    writer = PdfWriter()
+
+    # Parsed once per invoice; PdfReader is not shared between threads
+    watermark_page = PdfReader(BytesIO(watermark_pdf())).pages[0]
+    for page in reader.pages:
+        page.merge_page(watermark_page)
+        writer.add_page(page)
+
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def get_invoice(order):
+    """
+    The order's Invoice with an up-to-date ``pdf`` file, rendering and storing
+    it only when the printed content changed since it was last generated.
+    """
+    invoice, _ = Invoice.objects.get_or_create(order=order)
+
+    # invoice.html loops over order.items.all: serve it from one prefetch
+    prefetch_related_objects(
+        [order],
+        Prefetch(
+            "items",
+            queryset=OrderItem.objects.select_related("product").only(
+                "id", "order_id", "quantity", "price", "total", "product__id", "product__product_name"
+            ),
+        ),
+    )
+    items = list(order.items.all())
+
+    charges = charge_settings()
+    gst_percentage = charges.gst_percentage if charges.gst_configured else DEFAULT_INVOICE_GST_PERCENTAGE
+
+    context = _invoice_context(invoice, order, items, gst_percentage)
+    content_hash = _content_hash(context)
+
+    if invoice.pdf and invoice.content_hash == content_hash and invoice.pdf.storage.exists(invoice.pdf.name):
+        return invoice
+
+    pdf_bytes = render_invoice_pdf(context)
+
+    if invoice.pdf:
+        invoice.pdf.delete(save=False)
+    invoice.pdf.save(f"invoice_{invoice.invoice_number}.pdf", ContentFile(pdf_bytes), save=False)
+    invoice.content_hash = content_hash
+    invoice.save(update_fields=["pdf", "content_hash", "updated_at"])
+
+    return invoice
@@ -0,0 +1,208 @@
+"""
+Push channel for customer notifications (Server-Sent Events).
+
+``customer-notifications/<id>/stream/`` keeps one response open per tab and
+writes each new Notification as an SSE event, so clients no longer poll.
+It needs the ASGI application (Back_end/asgi.py).
+
+Fan-out is a wake-up signal only: when notifications are created for a
+customer (products/notifications.py), their open streams are woken and
+read ``id > last sent id`` from the database. The same query serves
+``Last-Event-ID`` / ``?last_id=`` resumes, so nothing is lost between
+reconnects.
+
+On PostgreSQL, wake-ups go through NOTIFY on NOTIFY_CHANNEL and a listener
+thread in every worker feeds its local hub, so a notification created by
+one worker reaches streams held by any other. Other backends wake the
+local hub directly (single process).
+"""
+import asyncio
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "customer_notifications"
+
+# NOTIFY payloads are limited to 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+
+def heartbeat_interval():
+    return getattr(settings, "NOTIFICATION_STREAM_HEARTBEAT", 15)
+
+
+class NotificationHub:
+    """Per-process registry of open streams: customer_id -> asyncio queues."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, customer_id):
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[customer_id].add((loop, queue))
+        start_listener()
+        return queue
+
+    def unsubscribe(self, customer_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(customer_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(customer_id, None)
+
+    def wake(self, customer_ids=None):
+        """Wake the streams of ``customer_ids`` (all streams when None). Safe from any thread."""
+        with self._lock:
+            if customer_ids is None:
+                targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+            else:
+                targets = [s for cid in customer_ids for s in self._subscribers.get(cid, ())]
+
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, True)
+            except RuntimeError:
+                # Loop already closed: the stream is going away
+                pass
+
+
+hub = NotificationHub()
+
+
+# ---------------------------------------------------------------
+# Publishing (called after the notifications are committed)
+# ---------------------------------------------------------------
+def _notify_payloads(customer_ids):
+    payload = ""
+    for cid in sorted(set(customer_ids)):
+        part = str(cid)
+        if payload and len(payload) + len(part) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            yield payload
+            payload = ""
+        payload = f"{payload},{part}" if payload else part
+    if payload:
+        yield payload
+
+
+def publish_notifications(customer_ids):
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            for payload in _notify_payloads(customer_ids):
+                cursor.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, payload])
+    else:
+        hub.wake(set(customer_ids))
+
+
+# ---------------------------------------------------------------
+# PostgreSQL LISTEN bridge
+#
+# One thread and connection per process LISTENs on every registered
+# channel. Other modules share it through listen_channel() (e.g. the
+# payment settings cache).
+# ---------------------------------------------------------------
+_channels = {}  # channel -> (on_message(payloads), on_listen())
+_channels_lock = threading.Lock()
+
+
+def listen_channel(channel, on_message, on_listen=None):
+    """
+    Call ``on_message(payloads)`` for NOTIFYs on ``channel`` in this process.
+    ``on_listen()`` runs each time the channel starts being listened to
+    (first start and every reconnect), since NOTIFYs sent before that were
+    not received.
+    """
+    with _channels_lock:
+        _channels[channel] = (on_message, on_listen)
+    start_listener()
+
+
+class NotificationListener(threading.Thread):
+    """LISTENs on the registered channels with its own connection and dispatches NOTIFYs."""
+
+    def __init__(self, alias="default", poll_timeout=1, retry_delay=5):
+        super().__init__(name="notification-listener", daemon=True)
+        self.alias = alias
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _listen_new_channels(self, conn, listening):
+        with _channels_lock:
+            channels = dict(_channels)
+        for channel in set(channels) - listening:
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            listening.add(channel)
+            on_listen = channels[channel][1]
+            if on_listen:
+                on_listen()
+
+    def _dispatch(self, conn):
+        conn.poll()
+        payloads = defaultdict(list)
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            payloads[notify.channel].append(notify.payload)
+
+        with _channels_lock:
+            channels = dict(_channels)
+        for channel, messages in payloads.items():
+            if channel in channels:
+                channels[channel][0](messages)
+
+    def listen(self):
+        wrapper = connections[self.alias]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            listening = set()
+            while not self._stop_event.is_set():
+                # Channels registered since the last round
+                self._listen_new_channels(conn, listening)
+                if select.select([conn], [], [], self.poll_timeout) != ([], [], []):
+                    self._dispatch(conn)
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Notification listener lost its connection, retrying")
+                self._stop_event.wait(self.retry_delay)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener():
+    """Start this process's LISTEN thread on first use (PostgreSQL only)."""
+    global _listener
+    if connection.vendor != "postgresql":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = NotificationListener()
+            _listener.start()
+
+
+def _wake_from_payloads(payloads):
+    hub.wake({int(cid) for payload in payloads for cid in payload.split(",") if cid})
+
+
+# Anything sent while we were not listening: let every stream re-read
+_channels[NOTIFY_CHANNEL] = (_wake_from_payloads, hub.wake)
@@ -0,0 +1,112 @@
+"""
+Product rating statistics.
+
+ProductRatingStats holds, per product, the number of approved reviews for
+each star and their sum. Every ProductFeedback write applies only its own
+delta with F() expressions (create, rating change, approve, reject,
+delete, cascades included), and Product.average_rating is set from the same row, so neither
+side ever scans a product's reviews. Only approved reviews count.
+
+``manage.py rebuild_rating_stats`` recomputes everything from the reviews.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+
+from .models import Product, ProductRatingStats
+
+STARS = range(1, 6)
+
+RATING_FIELD = DecimalField(max_digits=3, decimal_places=2)
+
+
+def _contribution(state):
+    """Stats a (product_id, rating, is_approved) review adds, as {product_id: {column: n}}."""
+    if state is None:
+        return {}
+    product_id, rating, approved = state
+    if not approved or rating not in STARS:
+        return {}
+    return {product_id: {f"stars_{rating}": 1, "rating_sum": rating, "approved_count": 1}}
+
+
+def _sync_average_rating(products):
+    """Set average_rating on ``products`` (a queryset) from their stats rows, in one UPDATE."""
+    average = (
+        ProductRatingStats.objects.filter(product=OuterRef("pk"), approved_count__gt=0)
+        .annotate(average=Round(F("rating_sum") * Decimal("1.0") / F("approved_count"), 2))
+        .values("average")[:1]
+    )
+    products.update(average_rating=Coalesce(Subquery(average), Value(Decimal("0.00")), output_field=RATING_FIELD))
+
+
+def apply_rating_change(before, after):
+    """
+    Move a review's contribution from ``before`` to ``after`` (each a
+    (product_id, rating, is_approved) tuple, None for created / deleted).
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for state, sign in ((before, -1), (after, 1)):
+        for product_id, columns in _contribution(state).items():
+            for column, value in columns.items():
+                deltas[product_id][column] += sign * value
+
+    deltas = {pid: {c: v for c, v in columns.items() if v} for pid, columns in deltas.items()}
+    deltas = {pid: columns for pid, columns in deltas.items() if columns}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        # Only a gaining product can lack its row. Removals never insert one: in a
+        # product delete cascade the row (and the product) are going away.
+        gaining = [pid for pid, columns in deltas.items() if columns.get("approved_count", 0) > 0]
+        ProductRatingStats.objects.bulk_create(
+            [ProductRatingStats(product_id=pid) for pid in gaining], ignore_conflicts=True
+        )
+        for product_id, columns in deltas.items():
+            ProductRatingStats.objects.filter(product_id=product_id).update(
+                **{column: F(column) + value for column, value in columns.items()}
+            )
+        _sync_average_rating(Product.objects.filter(id__in=list(deltas)))
+
+
+def rating_summary(product_id):
+    """The summary endpoint's payload, from one primary-key lookup."""
+    stats = ProductRatingStats.objects.filter(product_id=product_id).first() or ProductRatingStats(product_id=product_id)
+    counts = stats.star_counts()
+    total = stats.approved_count
+
+    return {
+        "average": round(stats.average, 2),
+        "total": total,
+        "counts": counts,
+        "percentage": {
+            star: round((count / total) * 100, 2) if total > 0 else 0
+            for star, count in counts.items()
+        },
+    }
+
+
+def rebuild_rating_stats():
+    """Recompute every product's stats and average_rating from its approved reviews."""
+    approved = Q(feedbacks__is_approved=True, feedbacks__rating__in=list(STARS))
+    rows = Product.objects.annotate(
+        approved_count=Count("feedbacks", filter=approved),
+        rating_sum=Sum("feedbacks__rating", filter=approved, default=0),
+        **{f"stars_{star}": Count("feedbacks", filter=approved & Q(feedbacks__rating=star)) for star in STARS},
+    ).values("id", "approved_count", "rating_sum", *(f"stars_{star}" for star in STARS))
+
+    stats = [
+        ProductRatingStats(product_id=row.pop("id"), **row)
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        ProductRatingStats.objects.all().delete()
+        ProductRatingStats.objects.bulk_create(stats, batch_size=1000)
+        _sync_average_rating(Product.objects.all())
+
+    return len(stats)
@@ -0,0 +1,159 @@
+"""
+Daily sales rollups for the admin dashboard.
+
+An order counts toward sales while its payment succeeded and it has not
+been cancelled or returned. Whenever that changes, the order's total and
+its lines are added to (or taken off) DailySalesRollup and
+DailyProductSalesRollup for the day it was placed, in the same transaction
+that flips ``OrderDetails.counted_in_sales``.
+
+The OrderDetails receivers in products/signals.py drive this;
+``manage.py rebuild_sales_rollups`` recomputes everything from scratch.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSalesRollup, DailySalesRollup, OrderDetails, OrderItem
+
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+
+NOT_COUNTED_STATUSES = [OrderDetails.OrderStatus.CANCELLED, OrderDetails.OrderStatus.RETURNED]
+
+# Same rule as counts_toward_sales(), for querysets
+COUNTED_ORDERS = Q(payment_status=OrderDetails.PaymentStatus.SUCCESS) & ~Q(status__in=NOT_COUNTED_STATUSES)
+
+
+def counts_toward_sales(order):
+    return (
+        order.payment_status == OrderDetails.PaymentStatus.SUCCESS
+        and order.status not in NOT_COUNTED_STATUSES
+    )
+
+
+def _order_lines(order_id):
+    return (
+        OrderItem.objects.filter(order_id=order_id)
+        .values("product_id")
+        .annotate(
+            units=Sum("quantity"),
+            revenue=Sum(F("quantity") * F("price"), output_field=MONEY),
+        )
+    )
+
+
+def _apply(order, sign):
+    """Add (sign=1) or remove (sign=-1) an order's amounts from the rollups."""
+    day = timezone.localdate(order.ordered_at)
+
+    DailySalesRollup.objects.bulk_create([DailySalesRollup(date=day)], ignore_conflicts=True)
+    DailySalesRollup.objects.filter(date=day).update(
+        order_count=F("order_count") + sign,
+        total_sales=F("total_sales") + sign * (order.total_amount or Decimal("0.00")),
+    )
+
+    lines = list(_order_lines(order.pk))
+    if not lines:
+        return
+
+    DailyProductSalesRollup.objects.bulk_create(
+        [DailyProductSalesRollup(date=day, product_id=line["product_id"]) for line in lines],
+        ignore_conflicts=True,
+    )
+    DailyProductSalesRollup.objects.filter(
+        date=day, product_id__in=[line["product_id"] for line in lines]
+    ).update(
+        units=F("units") + Case(
+            *[When(product_id=line["product_id"], then=Value(sign * line["units"])) for line in lines],
+        ),
+        revenue=F("revenue") + Case(
+            *[When(product_id=line["product_id"], then=Value(sign * line["revenue"])) for line in lines],
+            output_field=MONEY,
+        ),
+    )
+
+
+def sync_order_sales(order_id):
+    """Bring one order's contribution to the rollups in line with its current state."""
+    with transaction.atomic():
+        order = (
+            OrderDetails.objects.select_for_update()
+            .only("id", "status", "payment_status", "total_amount", "ordered_at", "counted_in_sales")
+            .filter(pk=order_id)
+            .first()
+        )
+        if order is None:
+            return
+
+        counted = counts_toward_sales(order)
+        if counted == order.counted_in_sales:
+            return
+
+        _apply(order, 1 if counted else -1)
+        OrderDetails.objects.filter(pk=order.pk).update(counted_in_sales=counted)
+
+
+def exclude_from_sales(order):
+    """
+    Take a counted order off the rollups as currently stored, e.g. before its
+    amounts or lines are edited. The next sync_order_sales() adds it back.
+    """
+    with transaction.atomic():
+        stored = (
+            OrderDetails.objects.select_for_update()
+            .only("id", "total_amount", "ordered_at")
+            .filter(pk=order.pk, counted_in_sales=True)
+            .first()
+        )
+        if stored is not None:
+            _apply(stored, -1)
+            OrderDetails.objects.filter(pk=stored.pk).update(counted_in_sales=False)
+    order.counted_in_sales = False
+
+
+def rebuild_sales_rollups():
+    """Recompute both rollup tables and every counted_in_sales flag from the orders."""
+    with transaction.atomic():
+        DailySalesRollup.objects.all().delete()
+        DailyProductSalesRollup.objects.all().delete()
+
+        OrderDetails.objects.filter(COUNTED_ORDERS).update(counted_in_sales=True)
+        OrderDetails.objects.exclude(COUNTED_ORDERS).update(counted_in_sales=False)
+
+        days = (
+            OrderDetails.objects.filter(counted_in_sales=True)
+            .annotate(day=TruncDate("ordered_at"))
+            .values("day")
+            .annotate(
+                order_count=Count("id"),
+                total_sales=Coalesce(Sum("total_amount"), Decimal("0.00"), output_field=MONEY),
+            )
+            .order_by()
+        )
+        DailySalesRollup.objects.bulk_create(
+            [DailySalesRollup(date=d["day"], order_count=d["order_count"], total_sales=d["total_sales"]) for d in days],
+            batch_size=1000,
+        )
+
+        lines = (
+            OrderItem.objects.filter(order__counted_in_sales=True)
+            .annotate(day=TruncDate("order__ordered_at"))
+            .values("day", "product_id")
+            .annotate(
+                units=Sum("quantity"),
+                revenue=Sum(F("quantity") * F("price"), output_field=MONEY),
+            )
+            .order_by()
+        )
+        DailyProductSalesRollup.objects.bulk_create(
+            [
+                DailyProductSalesRollup(date=l["day"], product_id=l["product_id"], units=l["units"], revenue=l["revenue"])
+                for l in lines.iterator(chunk_size=2000)
+            ],
+            batch_size=1000,
+        )
+
+    return DailySalesRollup.objects.count(), DailyProductSalesRollup.objects.count()
@@ -0,0 +1,117 @@
+"""
+Minimal periodic runner for in-process / management-command background tasks.
+
+A task is a callable returning the datetime it next wants to run (or None).
+The runner sleeps until then, but never longer than ``max_interval`` seconds
+so changes made by other processes are picked up.
+
+With ``single_instance``, only one runner of that name runs its task at a
+time across all processes: on PostgreSQL it must hold a session advisory
+lock on a connection of its own. The others stand by and take over when
+the holder's connection goes away. Other backends run a single process.
+
+In-process runners are started by start_in_process_runners() from the
+server entry points (Back_end/asgi.py, wsgi.py), not from AppConfig.ready(),
+so management commands, shells and export pool processes never start them.
+"""
+import logging
+import threading
+import zlib
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicRunner(threading.Thread):
+
+    def __init__(self, name, task, max_interval=300, min_interval=1, single_instance=False):
+        super().__init__(name=name, daemon=True)
+        self.task = task
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.single_instance = single_instance
+        self.lock_id = zlib.crc32(f"products.scheduler:{name}".encode())
+        self._lock_conn = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _release_lock(self):
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.close()
+            except Exception:
+                pass
+            self._lock_conn = None
+
+    def holds_lock(self):
+        """Whether this runner may run its task now (always, unless single_instance on PostgreSQL)."""
+        if not self.single_instance or connection.vendor != "postgresql":
+            return True
+        try:
+            if self._lock_conn is None:
+                wrapper = connections["default"]
+                conn = wrapper.get_new_connection(wrapper.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.lock_id])
+                    acquired = cursor.fetchone()[0]
+                if not acquired:
+                    conn.close()
+                    return False
+                self._lock_conn = conn
+            else:
+                # The lock lives as long as its connection: make sure that one is still up
+                with self._lock_conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            logger.exception("Periodic task %s could not check its lock", self.name)
+            self._release_lock()
+            return False
+
+    def run_once(self):
+        """Run the task and return how many seconds to wait before the next run."""
+        if not self.holds_lock():
+            # Another process runs it: check again later in case it went away
+            return self.max_interval
+        close_old_connections()
+        try:
+            next_run = self.task()
+        except Exception:
+            logger.exception("Periodic task %s failed", self.name)
+            next_run = None
+        finally:
+            close_old_connections()
+
+        if next_run is None:
+            return self.max_interval
+        delay = (next_run - timezone.now()).total_seconds()
+        return min(self.max_interval, max(self.min_interval, delay))
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                self._stop_event.wait(self.run_once())
+        finally:
+            self._release_lock()
+
+
+def start_in_process_runners():
+    """Start the background tasks enabled in settings in this (server) process."""
+    # Optional in-process offer scheduler (otherwise: manage.py run_offer_scheduler)
+    if getattr(settings, "OFFER_SCHEDULER_IN_PROCESS", False):
+        from products.offers import run_offer_sync
+        PeriodicRunner("offer-scheduler", run_offer_sync, single_instance=True).start()
+
+    # Optional in-process reservation sweeper (otherwise: manage.py sweep_reservations)
+    if getattr(settings, "RESERVATION_SWEEPER_IN_PROCESS", False):
+        from products.inventory import run_reservation_sweep
+        interval = getattr(settings, "RESERVATION_SWEEP_INTERVAL", 60)
+        PeriodicRunner(
+            "reservation-sweeper", run_reservation_sweep, max_interval=interval, single_instance=True
+        ).start()
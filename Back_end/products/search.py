@@ -0,0 +1,159 @@
+"""
+Product search: PostgreSQL full-text search with a pg_trgm fallback.
+
+``Product.search_vector`` holds a weighted tsvector of the product name
+(A), category name (B) and description (C). Names are stored normalized
+with underscores (see normalize_product_name), so underscores are turned
+into spaces before indexing and before parsing the query.
+
+Matches are ranked by ts_rank, then by trigram word similarity of the
+name, which also catches typos ("cocunut") the tsquery misses.
+On other database backends the old icontains search is used.
+"""
+import re
+from decimal import Decimal
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Replace
+
+from .models import Category, OrderDetails, Product
+
+SEARCH_CONFIG = "english"
+
+
+def _spaced(expression):
+    return Replace(expression, Value("_"), Value(" "))
+
+
+def _product_search_vector():
+    category_name = Subquery(Category.objects.filter(pk=OuterRef("category_id")).values("category_name")[:1])
+    return (
+        SearchVector(_spaced(F("product_name")), weight="A", config=SEARCH_CONFIG)
+        + SearchVector(_spaced(Coalesce(category_name, Value(""))), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(F("product_description"), Value(""), output_field=TextField()), weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def is_supported():
+    return connection.vendor == "postgresql"
+
+
+def update_search_vectors(queryset):
+    """Recompute search_vector for every product in ``queryset`` with one UPDATE."""
+    if is_supported():
+        queryset.update(search_vector=_product_search_vector())
+
+
+def _prefix_query(text):
+    """'cocon oil' -> 'cocon:* & oil:*' so results follow each keystroke."""
+    terms = re.findall(r"\w+", text.replace("_", " "))
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def search_products(queryset, text):
+    text = text.replace("_", " ").strip()
+    if not text:
+        return queryset
+
+    if not is_supported():
+        return queryset.filter(
+            Q(product_name__icontains=text.replace(" ", "_"))
+            | Q(product_name__icontains=text)
+            | Q(product_description__icontains=text)
+            | Q(category__category_name__icontains=text)
+        )
+
+    prefix = _prefix_query(text)
+    if not prefix:
+        return queryset.none()
+
+    query = SearchQuery(prefix, search_type="raw", config=SEARCH_CONFIG)
+    return (
+        queryset.filter(Q(search_vector=query) | Q(product_name__trigram_word_similar=text))
+        .annotate(
+            rank=SearchRank(F("search_vector"), query),
+            similarity=TrigramWordSimilarity(text, "product_name"),
+        )
+        .order_by(F("rank").desc(nulls_last=True), "-similarity", "-created_at")
+    )
+
+
+# ---------------------------------------------------------------
+# Order search
+#
+# The search box is parsed into typed terms so each one can use an index
+# on order_details instead of casting every column to text:
+#   ORD-20250101-12     -> order_number prefix
+#   shipped / success   -> status / payment_status
+#   500 | 500.50        -> total_amount = 500 (or courier number prefix)
+#   500-1000 | >500     -> total_amount range
+#   anything else       -> courier number / courier name prefix
+# Terms are AND-ed together.
+# ---------------------------------------------------------------
+AMOUNT_RANGE_RE = re.compile(r"^(\d+(?:\.\d{1,2})?)\s*-\s*(\d+(?:\.\d{1,2})?)$")
+AMOUNT_COMPARE_RE = re.compile(r"^(>=|<=|>|<)(\d+(?:\.\d{1,2})?)$")
+AMOUNT_RE = re.compile(r"^(?:₹|rs\.?)?(\d+(?:\.\d{1,2})?)$", re.IGNORECASE)
+ORDER_NUMBER_RE = re.compile(r"^ORD(?:-\d{0,8}(?:-\d{0,6})?)?$", re.IGNORECASE)
+
+AMOUNT_LOOKUPS = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte"}
+
+
+def _status_lookup(term):
+    key = term.lower().replace(" ", "_")
+    if key in OrderDetails.OrderStatus.values:
+        return Q(status=key)
+    if key in OrderDetails.PaymentStatus.values:
+        return Q(payment_status=key)
+    return None
+
+
+def _courier_prefix(term):
+    return Q(courier_number__istartswith=term) | Q(preferred_courier_service__istartswith=term)
+
+
+def parse_order_search(text):
+    """Turn the raw search string into a Q of index-friendly lookups."""
+    query = Q()
+    for term in text.split():
+        if ORDER_NUMBER_RE.match(term):
+            query &= Q(order_number__startswith=term.upper())
+            continue
+
+        status_q = _status_lookup(term)
+        if status_q is not None:
+            query &= status_q
+            continue
+
+        match = AMOUNT_RANGE_RE.match(term)
+        if match:
+            low, high = sorted((Decimal(match.group(1)), Decimal(match.group(2))))
+            query &= Q(total_amount__gte=low, total_amount__lte=high)
+            continue
+
+        match = AMOUNT_COMPARE_RE.match(term)
+        if match:
+            query &= Q(**{f"total_amount__{AMOUNT_LOOKUPS[match.group(1)]}": Decimal(match.group(2))})
+            continue
+
+        match = AMOUNT_RE.match(term)
+        if match:
+            # A bare number may be an amount, the start of a courier number
+            # or, with 8 digits, the date part of an order number
+            term_q = Q(total_amount=Decimal(match.group(1))) | _courier_prefix(term)
+            if len(term) == 8 and term.isdigit():
+                term_q |= Q(order_number__startswith=f"ORD-{term}")
+            query &= term_q
+            continue
+
+        query &= _courier_prefix(term)
+    return query
+
+
+def search_orders(queryset, search=None, order_number=None):
+    if order_number:
+        return queryset.filter(order_number__startswith=order_number.strip().upper())
+    if search and search.strip():
+        return queryset.filter(parse_order_search(search.strip()))
+    return queryset
@@ -1,8 +1,13 @@
 from rest_framework import serializers
 from .models import *
 from .utils import get_display_product
+from .offers import active_offers
+from .rollups import exclude_from_sales
+from .orders import create_order_lines, lines_subtotal, replace_order_lines
 from decimal import Decimal, ROUND_HALF_UP
 from django.db.models import Sum
+from django.db import transaction
+from django.urls import reverse
 
 def normalize_category_name(name: str):
     """Convert spaces to underscores and lowercase for DB storage"""
@@ -44,7 +49,7 @@ class ProductSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ["search_vector"]
 
     # ✅ Normalize product name on save
     def validate_product_name(self, value):
@@ -117,33 +122,40 @@ class OrderDetailsSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["order_number", "ordered_at"]
 
-    
+    def validate_status(self, value):
+        if self.instance is not None and not self.instance.can_change_status(value):
+            raise serializers.ValidationError(f"Order cannot go from '{self.instance.status}' to '{value}'.")
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop("items")
-        order = OrderDetails.objects.create(**validated_data)
 
-        subtotal = 0
-        for item_data in items_data:
-            item = OrderItem.objects.create(order=order, **item_data)
-            subtotal += item.price * item.quantity
+        # Totals first, so the header is written once; lines in one INSERT
+        subtotal = lines_subtotal(items_data)
+        validated_data["subtotal"] = subtotal
+        validated_data["total_amount"] = subtotal + validated_data.get("tax", 0) + validated_data.get("shipping_cost", 0)
 
-        order.subtotal = subtotal
-        order.total_amount = subtotal + order.tax + order.shipping_cost
-        order.save()
+        order = OrderDetails.objects.create(**validated_data)
+        create_order_lines(order, items_data)
 
         return order
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         items_data = validated_data.pop("items", None)
+
+        # Amounts and lines may change: take the stored order off the sales
+        # rollups, the post_save sync adds it back as saved below
+        exclude_from_sales(instance)
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         if items_data is not None:
-            instance.items.all().delete()
-            subtotal = 0
-            for item_data in items_data:
-                item = OrderItem.objects.create(order=instance, **item_data)
-                subtotal += item.price * item.quantity
+            # Diff into bulk delete / update / create instead of recreating every line
+            replace_order_lines(instance, items_data)
+            subtotal = lines_subtotal(items_data)
 
             instance.subtotal = subtotal
             instance.total_amount = subtotal + instance.tax + instance.shipping_cost
@@ -263,25 +275,16 @@ class ProductWithOfferSerializer(serializers.ModelSerializer):
     #  OFFER HELPERS  (MUST NOT REMOVE)
     # ---------------------------------------
     def _offer_is_active(self, offer):
-        """Check if an offer is active."""
-        if not offer or not offer.is_active:
-            return False
-
-        if not offer.offer_percentage:
-            return False
-
-        today = timezone.now().date()
-        try:
-            if offer.start_date and offer.end_date:
-                return offer.start_date <= today <= offer.end_date
-        except:
-            return True
-
-        return True
+        """Check if an offer is active (same rule as the product cards: OfferDetails.applies_on)."""
+        return bool(offer) and offer.applies_on(timezone.now().date())
     
     def get_available_stock(self, obj):
         """Stock shown to users = total stock - sum of all active reservations"""
 
+        # Annotated by Product.objects.with_available_stock() (no extra query)
+        if hasattr(obj, "available_qty"):
+            return obj.available_qty
+
         active_qty = ProductReservation.objects.filter(
             product=obj,
             reserved_until__gt=timezone.now()
@@ -290,11 +293,8 @@ class ProductWithOfferSerializer(serializers.ModelSerializer):
         return obj.stock_quantity - active_qty
 
     def _get_active_offer(self, obj):
-        """Return first valid offer from prefetched list."""
-        for off in obj.offers.all():
-            if self._offer_is_active(off):
-                return off
-        return None
+        """Return the product's active offer from the in-memory offer index."""
+        return active_offers.get(obj.id)
 
     # ---------------------------------------
     # OFFER DISPLAY VALUES
@@ -421,6 +421,101 @@ class ProductWithOfferSerializer(serializers.ModelSerializer):
         return rep
 
 
+class ProductCardSerializer(serializers.ModelSerializer):
+    """
+    Same output as ProductWithOfferSerializer, read from a precomputed
+    ProductCard (see products/cards.py) instead of resolving offers,
+    variants and stock per request.
+    """
+    id = serializers.IntegerField(source="product.id")
+    category_name = serializers.CharField(source="product.category.category_name", read_only=True)
+    product_name = serializers.CharField(source="product.product_name")
+    product_description = serializers.CharField(source="product.product_description")
+    price = serializers.DecimalField(source="product.price", max_digits=10, decimal_places=2)
+    offer_price = serializers.SerializerMethodField()
+    product_image = serializers.ImageField(source="product.product_image")
+    quantity = serializers.DecimalField(source="product.quantity", max_digits=10, decimal_places=2)
+    quantity_unit = serializers.CharField(source="product.quantity_unit")
+    stock_quantity = serializers.IntegerField(source="product.stock_quantity")
+    is_available = serializers.BooleanField(source="product.is_available")
+    average_rating = serializers.DecimalField(source="product.average_rating", max_digits=3, decimal_places=2)
+    active_variant = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField(source="product.created_at")
+    updated_at = serializers.DateTimeField(source="product.updated_at")
+    category = serializers.IntegerField(source="product.category_id")
+    created_by = serializers.IntegerField(source="product.created_by_id")
+
+    class Meta:
+        model = ProductCard
+        fields = [
+            "id",
+            "category_name",
+            "product_name",
+            "product_description",
+            "price",
+            "offer_percentage",
+            "offer_price",
+            "product_image",
+            "quantity",
+            "quantity_unit",
+            "stock_quantity",
+            "available_stock",
+            "is_available",
+            "average_rating",
+            "active_variant",
+            "created_at",
+            "updated_at",
+            "category",
+            "created_by",
+        ]
+
+    def get_offer_price(self, card):
+        return float(card.offer_price) if card.offer_price is not None else None
+
+    def get_active_variant(self, card):
+        v = card.active_variant
+        if not v:
+            return None
+        return {
+            "id": v.id,
+            "product_name": v.product_name,
+            "price": float(v.price),
+            "offer_price": float(card.active_variant_offer_price) if card.active_variant_offer_price is not None else None,
+            "quantity": v.quantity,
+            "quantity_unit": v.quantity_unit,
+            "stock_quantity": v.stock_quantity,
+        }
+
+    def to_representation(self, card):
+        rep = super().to_representation(card)
+
+        # Only when the listing was annotated for a customer (products/favorites.py)
+        if hasattr(card, "is_favorite"):
+            rep["is_favorite"] = card.is_favorite
+
+        raw_cat = rep.get("category_name")
+        if raw_cat:
+            rep["category_name"] = format_category_name(raw_cat)
+
+        # Main product displayed (rule A / rule C)
+        if card.display_product_id == card.product_id:
+            rep["product_name"] = format_name(rep["product_name"])
+            return rep
+
+        # Variant displayed (rule B / rule C)
+        v = card.display_product
+        rep["id"] = v.id
+        rep["product_name"] = format_name(v.product_name)
+        rep["price"] = float(v.price)
+        rep["quantity"] = v.quantity
+        rep["quantity_unit"] = v.quantity_unit
+        rep["stock_quantity"] = v.stock_quantity
+        rep["product_image"] = v.product_image.url if v.product_image else None
+        rep["is_available"] = v.is_available
+        rep["active_variant"] = None
+        return rep
+
+
 #Dashboard Serializers
 
 class DashboardStatsSerializer(serializers.Serializer):
@@ -666,3 +761,26 @@ class NotificationSerializer(serializers.ModelSerializer):
 
 # serializers.py
 
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "download_url",
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.Status.DONE:
+            return None
+        url = reverse("Export-Job-Download", args=[obj.id])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
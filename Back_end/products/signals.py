@@ -1,42 +1,123 @@
-from django.db.models.signals import pre_save
+from functools import partial
+
+from django.db.models.signals import post_save, pre_delete, post_delete, pre_migrate
 from django.dispatch import receiver
-from products.models import OrderDetails, Notification
+from django.db import transaction, connections
+from products.models import order_status_changed, OrderDetails, Product, ProductFeedback, OfferDetails, ProductReservation, Category
+from products.cards import schedule_card_refresh
+from products.offers import active_offers
+from products.search import update_search_vectors
+from products.rollups import sync_order_sales, exclude_from_sales, counts_toward_sales
+from products.notifications import notify_status_change, refresh_unread_count_after_order_delete
+from products.ratings import apply_rating_change
+
+@receiver(order_status_changed, sender=OrderDetails)
+def order_status_change(sender, order, previous, notified=False, **kwargs):
+    # Written in bulk once the status change commits (products/notifications.py);
+    # bulk_set_status already queued them for all its orders at once
+    if not notified:
+        notify_status_change([order])
+
+
+@receiver(post_delete, sender=OrderDetails)
+def order_notifications_on_delete(sender, instance, **kwargs):
+    # The order's notifications went with it (cascade): recount that customer's unread
+    transaction.on_commit(partial(refresh_unread_count_after_order_delete, instance.customer_id))
+
+
+# ---------------------------------------------------------------
+# Sales rollups (products/rollups.py)
+# ---------------------------------------------------------------
+SALES_SOURCE_FIELDS = {"status", "payment_status", "total_amount"}
+
+
+@receiver(post_save, sender=OrderDetails)
+def order_sales_rollup(sender, instance, created=False, **kwargs):
+    # Tracked fields still hold their pre-save values here. With any input
+    # deferred, let the sync read it once instead of loading each field.
+    if not (
+        created
+        or instance.get_deferred_fields() & (SALES_SOURCE_FIELDS | {"counted_in_sales"})
+        or any(instance.has_changed(f) for f in SALES_SOURCE_FIELDS)
+        or counts_toward_sales(instance) != instance.counted_in_sales
+    ):
+        return
+    # After commit, so the order lines written in the same transaction are included
+    transaction.on_commit(partial(sync_order_sales, instance.pk))
+
+
+@receiver(pre_delete, sender=OrderDetails)
+def order_sales_rollup_on_delete(sender, instance, **kwargs):
+    exclude_from_sales(instance)
+
+
+# ---------------------------------------------------------------
+# Rating stats (products/ratings.py). ProductFeedback.save applies its own
+# delta; deletes go through signals so cascades (customer or product
+# deleted) are counted too.
+# ---------------------------------------------------------------
+@receiver(pre_delete, sender=ProductFeedback)
+def feedback_rating_before_delete(sender, instance, **kwargs):
+    # Delete runs in a transaction: read what is stored under the row lock
+    instance._deleted_rating = instance._lock_stored_rating()
 
-def clean_label(text: str) -> str:
-    """Convert snake_case to 'Title Case' with spaces."""
-    return text.replace("_", " ").title()
 
-@receiver(pre_save, sender=OrderDetails)
-def order_status_change(sender, instance, **kwargs):
+@receiver(post_delete, sender=ProductFeedback)
+def feedback_rating_on_delete(sender, instance, **kwargs):
+    before = getattr(instance, "_deleted_rating", None)
+    if before is not None:
+        apply_rating_change(before, None)
 
-    # If new order, skip
-    if not instance.pk:
+
+# ---------------------------------------------------------------
+# Product cards: keep the listing rows in sync with their sources
+# ---------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Product)
+def product_card_on_product_change(sender, instance, created=False, **kwargs):
+    product_ids = {instance.parent_id or instance.id}
+    # A variant moved to another parent (or promoted / demoted): the card it was on changes too
+    if not created and instance.has_changed("parent_id"):
+        product_ids.add(instance.get_original("parent_id") or instance.id)
+    schedule_card_refresh(product_ids)
+
+
+@receiver([post_save, post_delete], sender=OfferDetails)
+@receiver([post_save, post_delete], sender=ProductReservation)
+def product_card_on_related_change(sender, instance, **kwargs):
+    schedule_card_refresh([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=OfferDetails)
+def offer_index_on_offer_change(sender, instance, **kwargs):
+    transaction.on_commit(active_offers.invalidate)
+
+
+# ---------------------------------------------------------------
+# Product search: keep search_vector current (products/search.py)
+# ---------------------------------------------------------------
+SEARCH_SOURCE_FIELDS = {"product_name", "product_description", "category"}
+# The same fields as Product tracks them (attnames)
+SEARCH_TRACKED_FIELDS = ("product_name", "product_description", "category_id")
+
+
+@receiver(post_save, sender=Product)
+def product_search_vector(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_SOURCE_FIELDS.intersection(update_fields):
+        return
+    # Tracked fields still hold their pre-save values here: stock / price edits skip the UPDATE
+    if not created and not any(instance.has_changed(f) for f in SEARCH_TRACKED_FIELDS):
         return
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def category_search_vectors(sender, instance, **kwargs):
+    update_search_vectors(Product.objects.filter(category=instance))
+
 
-    previous = OrderDetails.objects.get(pk=instance.pk)
-
-    # Only run when status actually changed
-    if previous.status != instance.status:
-
-        # 1️⃣ Create normal status update notification
-        status_clean = clean_label(instance.status)
-        Notification.objects.create(
-            customer=instance.customer,
-            order=instance,
-            type=Notification.NotificationType.ORDER_STATUS,
-            title="Order Status Updated",
-            message=f"Your order {instance.order_number} is now '{status_clean}'."
-        )
-
-        # 2️⃣ If delivered → create product rating notifications
-        if instance.status == OrderDetails.OrderStatus.DELIVERED:
-            for item in instance.items.all():  # fetch all products in order
-                product_name_clean = clean_label(item.product.product_name)
-                Notification.objects.create(
-                    customer=instance.customer,
-                    order=instance,
-                    product=item.product,
-                    type=Notification.NotificationType.PRODUCT_RATING,
-                    title="Rate Your Product",
-                    message=f"Please rate your experience with '{product_name_clean}'."
-                )
+@receiver(pre_migrate)
+def search_extensions(sender, using, **kwargs):
+    """pg_trgm must exist before the trigram index on products_details is created."""
+    if sender.name == "products" and connections[using].vendor == "postgresql":
+        with connections[using].cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
@@ -23,6 +23,7 @@ urlpatterns = [
     path("orderspdf/<int:order_id>/", InvoicePDFView.as_view(), name="order-invoice-pdf"),
 
     path("order-status/<int:id>/", OrderStatusUpdateView.as_view(), name="order-status-update"),
+    path("order-status/bulk/", BulkOrderStatusUpdateView.as_view(), name="order-status-bulk-update"),
 
     path("contactus/", ContactusView.as_view(), name="Contactus-View"),
     path("contactus/<int:pk>/", ContactusView.as_view(), name="Contactus-View"),
@@ -58,6 +59,7 @@ urlpatterns = [
     path("products/search/", GlobalProductSearchView.as_view(), name="global-product-search"),
 
     path("customer-notifications/<int:customer_id>/", CustomerNotifications.as_view(), name="Customer-Notifications"),
+    path("customer-notifications/<int:customer_id>/stream/", customer_notification_stream, name="Customer-Notification-Stream"),
     path("readnotifications/<int:id>/", MarkNotificationRead.as_view(), name="Mark-Notification-Read"),
     path("readnotifications/all/<int:customer_id>/", MarkAllNotificationsRead.as_view(),  name="Mark-All-Notifications"),
     path("notification/<int:id>/", DeleteNotification.as_view(),  name="Delete-Notification"),
@@ -70,6 +72,9 @@ urlpatterns = [
     path("single-orders/print-address/", PrintSingleAddressPDFView.as_view(), name="single-Print-Address-PDF"),
     path("orders/unprinted/", UnprintedOrdersView.as_view(), name="Unprinted-Orders"),
 
+    path("export-jobs/<uuid:job_id>/", ExportJobStatusView.as_view(), name="Export-Job-Status"),
+    path("export-jobs/<uuid:job_id>/download/", ExportJobDownloadView.as_view(), name="Export-Job-Download"),
+
 
 
 ]
@@ -2,6 +2,7 @@ import os
 from django.conf import settings
 from django.contrib.staticfiles import finders
 import urllib
+import re
 
 def get_display_product(product):
     """
@@ -58,4 +59,52 @@ def link_callback(uri, rel):
 
     raise Exception(
         f"Media URI must start with {settings.STATIC_URL} or file:// or be a valid path. Got: {uri}"
-    )
\ No newline at end of file
+    )
+
+
+def extract_location_details(address):
+    if not address:
+        return {"district": "", "pincode": ""}
+
+    location = {
+        "district": "",
+        "pincode": ""
+    }
+
+    # Extract pincode (6 digits)
+    pincode_match = re.search(r'\b(\d{6})\b', address)
+    if pincode_match:
+        location["pincode"] = pincode_match.group(1)
+
+    # Convert to lowercase for matching
+    addr = address.lower()
+
+    # Split by comma AND by hyphen to catch patterns like "salem - 636015"
+    parts = re.split(r'[,-]', addr)
+
+    # Clean parts
+    clean_parts = [p.strip() for p in parts if p.strip()]
+
+    # Find the district:
+    # Rule: the part *just before* the pincode or hyphen
+    for part in clean_parts:
+        if location["pincode"] in part:
+            continue  # skip pincode part
+
+    # Find district by scanning for valid words
+    for part in clean_parts:
+        # Skip numeric-only elements or pure door numbers
+        if part.replace("/", "").isdigit():
+            continue
+
+        # Skip long area descriptions
+        if len(part.split()) > 3:
+            continue
+        
+        # District candidate: the last short text part
+        district_candidate = part.strip()
+        if len(district_candidate) > 2:
+            location["district"] = district_candidate
+            break
+
+    return location
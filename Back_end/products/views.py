@@ -1,5 +1,7 @@
+import asyncio
 import json
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
 from num2words import num2words
 from django.utils.timezone import now, timedelta
 from reportlab.lib.pagesizes import A4
@@ -10,22 +12,37 @@ from rest_framework.response import Response
 from collections import OrderedDict
 from rest_framework import status,generics
 from django.template.loader import render_to_string
-from django.http import HttpResponse
 from xhtml2pdf import pisa
 from django.db.models import DecimalField,Sum, F,ExpressionWrapper
 from Back_end.pagination import CustomPageNumberPagination
 from django.utils.dateparse import parse_date
 from django.shortcuts import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from .models import *
 from .serializers import *
 from django.utils import timezone
 from django.db.models.functions import TruncDate,Coalesce,Cast
 from django.db.models import Prefetch, Q
 from payment.models import GSTSetting
+from payment.settings_cache import charge_settings, tag_response
 from django.db import transaction
 from .utils import *
+from .cards import product_cards
+from .offers import active_offers
+from .search import search_products, search_orders
+from .pdf import get_invoice, InvoiceRenderError
+from .labels import label_orders, write_address_labels, write_single_label
+from .exports import enqueue_export
+from .inventory import reserve_cart
+from .orders import bulk_set_status
+from .notifications import unread_count, mark_all_read, delete_notification, clear_notifications
+from .push import hub, heartbeat_interval
+from .ratings import rating_summary
+from .hierarchy import product_tree
+from .favorites import request_auth_id, parse_product_ids, favorite_flags, with_is_favorite, MAX_FLAG_PRODUCTS
 from reportlab.lib.units import mm
 import os
 from xhtml2pdf import default
@@ -308,153 +325,69 @@ class OrderDetailsView(generics.GenericAPIView):
         order.delete()
         return Response({"status": True, "message": "Order deleted"}, status=200)
     
-class InvoicePDFView(APIView):
-    @staticmethod
-    def format_product_name(name, max_length=18):
-        if not name:
-            return ""
-
-        name = name.replace("_", " ")
-        name = name.title()
-
-        result = ""
-        for word in name.split():
-            if len(result) + len(word) > max_length:
-                result += "\n" + word
-            else:
-                result += (" " + word if result else word)
+# ---------------------------------------------------------------
+# PDF exports: `?async=true` queues a job for `manage.py run_export_worker`
+# ---------------------------------------------------------------
+def is_async(request):
+    return request.query_params.get("async", "false").lower() == "true"
 
-        return result
 
-    def get(self, request, order_id):
-        # Get order and invoice
-        order = get_object_or_404(OrderDetails, id=order_id)
-        invoice, _ = Invoice.objects.get_or_create(order=order)
-
-        # GST + totals
-        gst_setting = GSTSetting.objects.first()
-        gst_percentage = gst_setting.gst_percentage if gst_setting else Decimal("18.00")
-
-        subtotal = sum(float(item.price) * item.quantity for item in order.items.all())
-        gst_amount = subtotal * float(gst_percentage) / 100
-        shipping = float(order.shipping_cost or 0)
-        total_amount = subtotal + gst_amount + shipping
-
-        amount_in_words = amount_in_words_indian(total_amount)
-
-        # Paths
-        logo_path = os.path.join(settings.BASE_DIR, "static", "image", "Logo.jpeg")
-        font_path = os.path.join(settings.BASE_DIR, "static", "fonts", "DejaVuSans.ttf")
-
-        # ✅ Register and embed DejaVuSans font
-        pdfmetrics.registerFont(TTFont("DejaVuSans", font_path))
-        registerFontFamily(
-            "DejaVuSans",
-            normal="DejaVuSans",
-            bold="DejaVuSans",
-            italic="DejaVuSans",
-            boldItalic="DejaVuSans",
-        )
+def export_queued(request, job):
+    return Response({
+        "status": True,
+        "message": "Export queued",
+        "data": ExportJobSerializer(job, context={"request": request}).data,
+    }, status=status.HTTP_202_ACCEPTED)
 
-        # ✅ Replace default Helvetica with DejaVuSans (fixes ₹ everywhere)
-        default.DEFAULT_FONT["helvetica"] = "DejaVuSans"
-        default.DEFAULT_FONT["Times-Roman"] = "DejaVuSans"
-        default.DEFAULT_FONT["Courier"] = "DejaVuSans"
-        default.DEFAULT_FONT["Helvetica"] = "DejaVuSans"
-        default.DEFAULT_FONT["Helvetica-Bold"] = "DejaVuSans"
-        default.DEFAULT_FONT["Helvetica-Oblique"] = "DejaVuSans"
-        default.DEFAULT_FONT["Helvetica-BoldOblique"] = "DejaVuSans"
-
-        # Company Info
-        company = {
-            "name": "Vallalar Naturals from Village Kannama",
-            "address": "No. 2, South Street, Abatharanapuram, Serakuppam Post, Vadalur - 607303.",
-            "email": "vallalarnaturalsvillagekannama@gmail.com",
-            "phone": "+91 7639157615",
-            "gstin": "33FEHPS4088N1ZP",
-            "logo_path": logo_path,
-            "font_path": font_path,
-        }
 
-        # Render HTML
-        html = render_to_string("invoice.html", {
-            "invoice_number": invoice.invoice_number,
-            "invoice_date": invoice.generated_at.strftime("%d-%b-%Y"),
-            "order": order,
-             "formatted_items": [
-        {
-            "name": self.format_product_name(item.product.product_name),
-            "qty": item.quantity,
-            "price": item.price,
-            "total": item.price * item.quantity,
-        }
-        for item in order.items.all()
-    ],
-            "customer": {
-                "name": f"{order.first_name or ''} {order.last_name or ''}".strip(),
-                "shipping_address": order.shipping_address,
-                "billing_address": order.billing_address,
-                "contact": order.contact_number,
-            },
-            "company": company,
-            "subtotal": f"{subtotal:.2f}",
-            "gst_percentage": gst_percentage,
-            "gst_amount": f"{gst_amount:.2f}",
-            "shipping": f"{shipping:.2f}",
-            "total_amount": f"{total_amount:.2f}",
-            "amount_in_words": amount_in_words,
-            "payment_method": order.payment_method,
-        })
+class ExportJobStatusView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id)
+        return Response({
+            "status": True,
+            "data": ExportJobSerializer(job, context={"request": request}).data,
+        }, status=status.HTTP_200_OK)
+
 
-        # Step 1: Generate base PDF in memory
-        pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(
-            html, dest=pdf_buffer, link_callback=link_callback, encoding="UTF-8"
+class ExportJobDownloadView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(ExportJob, id=job_id)
+
+        if job.status != ExportJob.Status.DONE or not job.result:
+            return Response({
+                "status": False,
+                "message": f"Export is {job.status}",
+                "data": ExportJobSerializer(job, context={"request": request}).data,
+            }, status=status.HTTP_409_CONFLICT)
+
+        return FileResponse(
+            job.result.open("rb"),
+            as_attachment=True,
+            filename=job.filename or f"{job.id}.pdf",
+            content_type="application/pdf",
         )
 
-        if pisa_status.err:
+
+class InvoicePDFView(APIView):
+
+    def get(self, request, order_id):
+        order = get_object_or_404(OrderDetails, id=order_id)
+
+        if is_async(request):
+            return export_queued(request, enqueue_export(ExportJob.Kind.INVOICE, order_id=order.id))
+
+        # Rendered once per order content, then served from storage
+        try:
+            invoice = get_invoice(order)
+        except InvoiceRenderError:
             return HttpResponse("Error generating PDF", status=500)
 
-        pdf_buffer.seek(0)
-        reader = PdfReader(pdf_buffer)
-        writer = PdfWriter()
-
-        # Step 2: Apply watermark background (transparent)
-        for page in reader.pages:
-            packet = BytesIO()
-            can = canvas.Canvas(packet, pagesize=(595.27, 841.89))  # A4 size
-            width, height = 595.27, 841.89
-
-            can.saveState()
-            logo = ImageReader(logo_path)
-            can.setFillAlpha(0.08)  # Transparency (0.0 - 1.0)
-
-            # Adjust background size/position
-            img_width = width * 0.9
-            img_height = img_width * 1.0
-            x = (width - img_width) / 2
-            y = (height - img_height) / 2
-
-            can.drawImage(logo, x, y, width=img_width, height=img_height, mask="auto")
-            can.restoreState()
-            can.save()
-
-            packet.seek(0)
-            watermark_pdf = PdfReader(packet)
-            watermark_page = watermark_pdf.pages[0]
-            page.merge_page(watermark_page)
-            writer.add_page(page)
-
-        # Step 3: Return final merged PDF
-        final_output = BytesIO()
-        writer.write(final_output)
-        final_output.seek(0)
-
-        response = HttpResponse(final_output, content_type="application/pdf")
-        response["Content-Disposition"] = (
-            f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
-        )
-        return response
+        return tag_response(FileResponse(
+            invoice.pdf.open("rb"),
+            as_attachment=True,
+            filename=f"invoice_{invoice.invoice_number}.pdf",
+            content_type="application/pdf",
+        ), charge_settings())
     
 class ProductListAPIView(APIView):
     permission_classes = [AllowAny]
@@ -465,7 +398,7 @@ class ProductListAPIView(APIView):
         # --- 1️⃣ Single Product by ID ---
         if id:
             try:
-                product = Product.objects.get(pk=id)
+                product = Product.objects.with_available_stock().get(pk=id)
             except Product.DoesNotExist:
                 return Response({
                     "success": False,
@@ -480,31 +413,31 @@ class ProductListAPIView(APIView):
                 "data": serializer.data
             }, status=status.HTTP_200_OK)
 
-        # --- 2️⃣ Multiple Products (no pagination) ---
-        qs = Product.objects.filter(parent__isnull=True).select_related("category").prefetch_related(
-            "offers",
-            Prefetch("variants", queryset=Product.objects.filter(is_available=True, stock_quantity__gt=0))
-            
-        )
+        # --- 2️⃣ Multiple Products (no pagination), read from precomputed cards ---
+        qs = product_cards()
+
+        # ❤️ Customer's favorites flagged in the same query
+        auth_id = request_auth_id(request)
+        if auth_id:
+            qs = with_is_favorite(qs, auth_id, product_field="display_product_id")
 
         # Apply offer_only filter if requested
         if offer_only:
             qs = qs.filter(
-                Q(offers__is_active=True) |
-                Q(variants__offers__is_active=True)
+                Q(product__offers__is_active=True) |
+                Q(product__variants__offers__is_active=True)
             ).distinct()
 
         # --- 3️⃣ Serialize all products (no pagination) ---
-        serializer = ProductWithOfferSerializer(qs.order_by("-created_at"), many=True)
-        
-
+        serializer = ProductCardSerializer(qs.order_by("-product__created_at"), many=True)
+        data = serializer.data
 
         # --- 4️⃣ Response ---
         return Response({
             "success": True,
             "message": "Products fetched successfully",
-            "total_items": qs.count(),
-            "data": serializer.data
+            "total_items": len(data),
+            "data": data
         }, status=status.HTTP_200_OK)
         
 class CategoryListAPIView(APIView):
@@ -547,17 +480,22 @@ class ProductFilter(APIView):
 
     def get(self, request, category_id=None):
         try:
-            # ✅ Only fetch main products (those without a parent)
-            products = Product.objects.filter(parent__isnull=True).order_by("-id")
+            # ✅ Only main products have cards
+            cards = product_cards().order_by("-product_id")
 
             # ✅ Filter by category if provided
             if category_id:
-                products = products.filter(category_id=category_id)
+                cards = cards.filter(product__category_id=category_id)
+
+            # ❤️ Customer's favorites flagged in the same query
+            auth_id = request_auth_id(request)
+            if auth_id:
+                cards = with_is_favorite(cards, auth_id, product_field="display_product_id")
 
             # ✅ Apply pagination
             paginator = CustomPageNumberPagination()
-            paginated_qs = paginator.paginate_queryset(products, request)
-            serializer = ProductWithOfferSerializer(paginated_qs, many=True)
+            paginated_qs = paginator.paginate_queryset(cards, request)
+            serializer = ProductCardSerializer(paginated_qs, many=True)
 
             # ✅ Return paginated response
             return paginator.get_paginated_response(serializer.data)
@@ -646,6 +584,12 @@ class OrderStatusUpdateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        if not order.can_change_status(order_status):
+            return Response(
+                {"message": f"Order cannot go from '{order.status}' to '{order_status}'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         # --- Update order ---
         order.status = order_status
 
@@ -669,6 +613,64 @@ class OrderStatusUpdateView(APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
 
+class BulkOrderStatusUpdateView(APIView):
+
+    def put(self, request):
+        order_ids = request.data.get("order_ids") or []
+        order_status = request.data.get("order_status")
+
+        # --- Validation ---
+        if not order_ids or not order_status:
+            return Response(
+                {"message": "order_ids and order_status are required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        valid_statuses = [choice[0] for choice in OrderDetails.OrderStatus.choices]
+        if order_status not in valid_statuses:
+            return Response(
+                {"message": f"Invalid status. Allowed values: {valid_statuses}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Compare database ids with ids, not with the raw JSON values ("1" vs 1, duplicates)
+        try:
+            if not isinstance(order_ids, list):
+                raise TypeError
+            order_ids = {int(order_id) for order_id in order_ids}
+        except (TypeError, ValueError):
+            return Response({"message": "order_ids must be a list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = list(OrderDetails.objects.filter(id__in=order_ids))
+        if len(orders) != len(order_ids):
+            return Response({"message": "Some orders were not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        # --- Shipping needs a courier number on every order ---
+        if order_status == OrderDetails.OrderStatus.SHIPPED:
+            missing = [o.order_number for o in orders if not o.courier_number]
+            if missing:
+                return Response(
+                    {"message": "courier_number is required when status is 'shipped'.", "orders": missing},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        # 🔄 One bulk UPDATE; notifications and sales rollups still follow every change
+        try:
+            updated = bulk_set_status(orders, order_status)
+        except InvalidStatusTransition as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {
+                "status": True,
+                "message": "Order status updated successfully.",
+                "order_status": order_status,
+                "updated": [o.id for o in updated],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class OfferPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
@@ -678,25 +680,14 @@ class OfferPagination(PageNumberPagination):
 class OfferDetailsView(APIView):
 
     def get(self, request, pk=None):
-        today = timezone.now().date()
-
-        # ✅ Deactivate expired offers
-        OfferDetails.objects.filter(end_date__lt=today, is_active=True).update(is_active=False)
-
-        # ✅ Activate offers that are now valid (current date within range)
-        OfferDetails.objects.filter(
-            start_date__lte=today,
-            end_date__gte=today,
-            is_active=False,
-        ).update(is_active=True)
-
+        # Read-only: is_active is maintained by the offer scheduler (products/offers.py)
         if pk:
             offer = get_object_or_404(OfferDetails, pk=pk)
             serializer = OfferDetailsSerializer(offer)
             return Response({"status": True, "data": serializer.data}, status=status.HTTP_200_OK)
 
         # ✅ Paginate all offers (newest first)
-        offers = OfferDetails.objects.all().order_by('-created_at')
+        offers = OfferDetails.objects.select_related("product", "category").order_by('-created_at')
         paginator = OfferPagination()
         result_page = paginator.paginate_queryset(offers, request)
         serializer = OfferDetailsSerializer(result_page, many=True)
@@ -765,20 +756,14 @@ class OfferDetailsView(APIView):
 class ProductsByCategory(APIView):
     def get(self, request, category_id):
         try:
-            today = timezone.now().date()
-
-            # ✅ Get IDs of products with currently active offers
-            active_offer_product_ids = OfferDetails.objects.filter(
-                category_id=category_id,
-                is_active=True,
-                start_date__lte=today,
-                end_date__gte=today,
-            ).values_list("product_id", flat=True)
+            # ✅ Get IDs of products with currently active offers (in-memory index)
+            active_offer_product_ids = active_offers.product_ids(category_id)
 
             # ✅ Filter products in this category WITHOUT active offers
             products = (
                 Product.objects.filter(category_id=category_id)
                 .exclude(id__in=active_offer_product_ids)
+                .select_related("category")
                 .only("id", "product_name", "category__category_name")
             )
 
@@ -820,34 +805,31 @@ class DashboardAPIView(APIView):
             last_7_days = now - timedelta(days=6)
 
             # ---------------- Stats ----------------
-            total_sales = OrderDetails.objects.filter(payment_status__iexact="success")\
-                .aggregate(total=Coalesce(Sum("total_amount"), Decimal("0.00"), output_field=DecimalField(max_digits=20, decimal_places=2)))["total"]
+            # Sales figures come from the daily rollups (products/rollups.py)
+            total_sales = DailySalesRollup.objects.aggregate(
+                total=Coalesce(Sum("total_sales"), Decimal("0.00"), output_field=DecimalField(max_digits=20, decimal_places=2))
+            )["total"]
+
+            order_counts = OrderDetails.objects.aggregate(
+                total_orders=Count("id"),
+                confirmed_orders=Count("id", filter=Q(status=OrderDetails.OrderStatus.ORDER_CONFIRMED)),
+                shipped_orders=Count("id", filter=Q(status=OrderDetails.OrderStatus.SHIPPED)),
+                delivered_orders=Count("id", filter=Q(status=OrderDetails.OrderStatus.DELIVERED)),
+            )
 
             stats = {
                 "total_sales": total_sales,
-                "total_orders": OrderDetails.objects.count(),
+                "total_orders": order_counts["total_orders"],
                 "total_customers": CustomerDetails.objects.count(),
                 "total_products": Product.objects.count(),
-                "confirmed_orders": OrderDetails.objects.filter(status__iexact="order_confirmed").count(),
-                "shipped_orders": OrderDetails.objects.filter(status__iexact="shipped").count(),
-                "delivered_orders": OrderDetails.objects.filter(status__iexact="delivered").count(),
+                "confirmed_orders": order_counts["confirmed_orders"],
+                "shipped_orders": order_counts["shipped_orders"],
+                "delivered_orders": order_counts["delivered_orders"],
 
             }
 
             # ---------------- Sales Chart (last 7 days) ----------------
-            sales_qs = (
-                OrderDetails.objects.filter(payment_status__iexact="success", ordered_at__date__gte=last_7_days.date())
-                .annotate(date=TruncDate("ordered_at"))
-                .values("date")
-                .annotate(
-                    sales=Coalesce(
-                        Sum("total_amount"), 
-                        Decimal("0.00"), 
-                        output_field=DecimalField(max_digits=20, decimal_places=2)
-                    )
-                )
-                .order_by("date")
-            )
+            sales_qs = DailySalesRollup.objects.filter(date__gte=last_7_days.date()).values("date", "total_sales")
 
             # Fill missing days with 0
             sales_chart_dict = OrderedDict()
@@ -856,18 +838,19 @@ class DashboardAPIView(APIView):
                 sales_chart_dict[day] = Decimal("0.00")
 
             for sale in sales_qs:
-                sales_chart_dict[sale["date"]] = sale["sales"]
+                sales_chart_dict[sale["date"]] = sale["total_sales"]
 
             sales_chart = [{"date": d, "sales": s} for d, s in sales_chart_dict.items()]
 
             # ---------------- Top Products ----------------
             top_products_qs = (
-                OrderItem.objects.filter(order__payment_status__iexact="success")
+                DailyProductSalesRollup.objects
                 .values("product_id", "product__product_name")
                 .annotate(
-                    total_sold=Coalesce(Sum("quantity"), 0),
-                    total_revenue=Coalesce(Sum(F("quantity") * F("price"), output_field=DecimalField(max_digits=20, decimal_places=2)), Decimal("0.00"))
+                    total_sold=Coalesce(Sum("units"), 0),
+                    total_revenue=Coalesce(Sum("revenue"), Decimal("0.00"), output_field=DecimalField(max_digits=20, decimal_places=2))
                 )
+                .filter(total_sold__gt=0)
                 .order_by("-total_sold")[:5]
             )
 
@@ -938,15 +921,9 @@ class StockAvailability(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            product = Product.objects.get(id=product_id)
-
-            # 🔥 Calculate available stock using ACTIVE reservations
-            active_qty = ProductReservation.objects.filter(
-                product=product,
-                reserved_until__gt=timezone.now()
-            ).aggregate(total=Sum("quantity"))["total"] or 0
-
-            available_stock = product.stock_quantity - active_qty
+            # 🔥 Available stock using ACTIVE reservations, in the same query
+            product = Product.objects.with_available_stock().get(id=product_id)
+            available_stock = product.available_qty
 
             return Response({
                 "status": True,
@@ -995,7 +972,7 @@ class FavoriteListView(APIView):
         product_ids = favorites.values_list("product_id", flat=True)
 
         # Fetch actual product objects
-        products = Product.objects.filter(id__in=product_ids).order_by("-created_at")
+        products = Product.objects.filter(id__in=product_ids).with_available_stock().order_by("-created_at")
 
         paginator = self.pagination_class()
         paginated_products = paginator.paginate_queryset(products, request)
@@ -1015,13 +992,29 @@ class FavoriteListView(APIView):
 
 class FavoriteListIdsView(APIView):
     def get(self, request):
-        auth_id = request.query_params.get("auth_id")
         product_id = request.query_params.get("product_id")
-        print("product_id",product_id)
+        product_ids = request.query_params.get("product_ids")
 
+        # Same customer as the listings' is_favorite: the logged-in user first
+        try:
+            auth_id = request_auth_id(request, strict=True)
+        except ValueError:
+            return Response({"error": "auth_id must be an id"}, status=400)
         if not auth_id:
             return Response({"error": "auth_id required"}, status=400)
 
+        # 🟢 CASE 0: Flags for a whole page of products (?product_ids=1,2,3), one query
+        if product_ids:
+            try:
+                product_ids = parse_product_ids(product_ids)
+            except ValueError:
+                return Response({"error": "product_ids must be a comma separated list of ids"}, status=400)
+            if len(product_ids) > MAX_FLAG_PRODUCTS:
+                return Response({"error": f"At most {MAX_FLAG_PRODUCTS} product_ids per request"}, status=400)
+
+            flags = favorite_flags(auth_id, product_ids)
+            return Response({"favorites": {str(pid): flag for pid, flag in flags.items()}})
+
         try:
             customer = CustomerDetails.objects.get(auth_id=auth_id)
         except CustomerDetails.DoesNotExist:
@@ -1261,34 +1254,8 @@ class ProductFeedbackListAPIView(APIView):
 class ProductRatingSummaryAPIView(APIView):
     permission_classes = [AllowAny]
     def get(self, request, product_id):
-        feedbacks = ProductFeedback.objects.filter(product_id=product_id,is_approved=True)
-
-        # total ratings
-        total = feedbacks.count()
-
-        # average rating
-        avg = feedbacks.aggregate(avg=Avg("rating"))["avg"] or 0
-
-        # count per star
-        star_counts = feedbacks.values("rating").annotate(count=Count("id"))
-
-        # format: {5:14, 4:6, ...}
-        counts = {str(i): 0 for i in range(1, 6)}
-        for item in star_counts:
-            counts[str(item["rating"])] = item["count"]
-
-        # percentage
-        percentage = {
-            star: round((count / total) * 100, 2) if total > 0 else 0
-            for star, count in counts.items()
-        }
-
-        return Response({
-            "average": round(avg, 2),
-            "total": total,
-            "counts": counts,
-            "percentage": percentage
-        }, status=status.HTTP_200_OK)
+        # ⭐ Maintained per-star counts (products/ratings.py): one primary-key lookup
+        return Response(rating_summary(product_id), status=status.HTTP_200_OK)
  
 class ProductFeedbackFilterAPIView(generics.ListAPIView):
     serializer_class = ProductFeedbackSerializer
@@ -1322,34 +1289,6 @@ class ProductFeedbackFilterAPIView(generics.ListAPIView):
 class AdminReviewListAPIView(APIView):
     pagination_class = AdminReviewPagination
 
-    def get_all_variants(self, product_id):
-        ids = [product_id]
-        queue = [product_id]
-
-        while queue:
-            pid = queue.pop(0)
-            children = Product.objects.filter(parent_id=pid).values_list("id", flat=True)
-            for cid in children:
-                ids.append(cid)
-                queue.append(cid)
-
-        return ids
-
-    def get_all_category_products(self, category_id):
-        product_ids = list(Product.objects.filter(category_id=category_id).values_list("id", flat=True))
-        queue = product_ids.copy()
-
-        while queue:
-            pid = queue.pop(0)
-            children = Product.objects.filter(parent_id=pid).values_list("id", flat=True)
-            for cid in children:
-                if cid not in product_ids:
-                    product_ids.append(cid)
-                    queue.append(cid)
-
-        return product_ids
-
-
     def get(self, request):
 
         product_id = request.query_params.get("product_id")
@@ -1361,13 +1300,12 @@ class AdminReviewListAPIView(APIView):
         qs = ProductFeedback.objects.all().select_related("product", "user")
 
         # ---- FILTERS ----
+        # Products with all their variants, one recursive CTE (products/hierarchy.py)
         if category_id:
-            product_ids = self.get_all_category_products(category_id)
-            qs = qs.filter(product_id__in=product_ids)
+            qs = qs.filter(product_id__in=product_tree(category_id=category_id))
 
         if product_id:
-            product_ids = self.get_all_variants(product_id)
-            qs = qs.filter(product_id__in=product_ids)
+            qs = qs.filter(product_id__in=product_tree(product_id=product_id))
 
         if rating:
             qs = qs.filter(rating=rating)
@@ -1462,36 +1400,44 @@ class AdminReviewDeleteAPIView(APIView):
             }, status=404)
 
 
+class OrderSearchPagination(CursorPagination):
+    """Keyset pagination on (created_at, id): cost per page does not grow with depth."""
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+    def get_paginated_response(self, data):
+        return Response({
+            "status": True,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "data": data,
+        }, status=status.HTTP_200_OK)
+
+
 class GlobalOrderSearchView(generics.ListAPIView):
     serializer_class = OrderDetailsSerializer
+    pagination_class = OrderSearchPagination
 
     def get_queryset(self):
-        queryset = OrderDetails.objects.all().select_related("customer").prefetch_related("items")
-
-        # ✅ Search by Order ID only
-        order_id = self.request.query_params.get("order_id")
-        if order_id:
-            return queryset.filter(order_number__icontains=order_id)
-
-        # ✅ Global search
-        search = self.request.query_params.get("search")
-        if search:
-            queryset = queryset.filter(
-                Q(order_number__icontains=search)
-                | Q(preferred_courier_service__icontains=search)
-                | Q(courier_number__icontains=search)
-                | Q(payment_status__icontains=search)
-                | Q(status__icontains=search)
-                | Q(total_amount__icontains=search)
-            )
+        queryset = OrderDetails.objects.select_related("customer").prefetch_related(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product"))
+        )
 
-        return queryset.order_by("-created_at")
+        # ✅ Search by order number prefix, or typed global search (products/search.py)
+        return search_orders(
+            queryset,
+            search=self.request.query_params.get("search"),
+            order_number=self.request.query_params.get("order_id"),
+        )
 
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return Response({"status": True, "data": serializer.data}, status=status.HTTP_200_OK)
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         except Exception as e:
             return Response({"status": False, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
@@ -1500,53 +1446,173 @@ class GlobalProductSearchView(generics.ListAPIView):
     permission_classes = [AllowAny]
 
     serializer_class = ProductWithOfferSerializer
+    pagination_class = ProductSetPagination
 
     def get_queryset(self):
-        queryset = Product.objects.all().select_related("category")
+        queryset = (
+            Product.objects.all()
+            .select_related("category")
+            .prefetch_related("variants")
+            .with_available_stock()
+            .order_by("-created_at")
+        )
 
-        # ✅ Global search
+        # ✅ Global search (ranked full-text + trigram, see products/search.py)
         search = self.request.query_params.get("search", "").strip()
         if search:
-            queryset = queryset.filter(
-                Q(product_name__icontains=search)
-                | Q(product_description__icontains=search)
-                | Q(category__category_name__icontains=search)
-            )
+            queryset = search_products(queryset, search)
 
-        return queryset.order_by("-created_at")
+        return queryset
 
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.get_queryset()
-            serializer = self.get_serializer(queryset, many=True)
-            return Response({"status": True, "data": serializer.data}, status=status.HTTP_200_OK)
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return Response({
+                "status": True,
+                "total_items": self.paginator.page.paginator.count,
+                "next": self.paginator.get_next_link(),
+                "previous": self.paginator.get_previous_link(),
+                "data": serializer.data,
+            }, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"status": False, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
+class NotificationFeedPagination(CursorPagination):
+    """Keyset pagination on (created_at, id), newest first."""
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+
+
 class CustomerNotifications(APIView):
     def get(self, request, customer_id):
+        notifications = (
+            Notification.objects.filter(customer_id=customer_id)
+            .select_related("product", "order")
+            .only(
+                "id", "title", "message", "type", "is_read", "created_at", "read_at",
+                "product__id", "product__product_name", "order__id", "order__order_number",
+            )
+        )
 
-        # 🔥 Auto-clear expired reservations (quick & safe)
-        product_ids = ProductReservation.objects.values_list("product_id", flat=True).distinct()
-        for pid in product_ids:
-            try:
-                product = Product.objects.get(id=pid)
-                product.available_stock()  # triggers cleanup
-            except Product.DoesNotExist:
-                pass
-
-        notifications = Notification.objects.filter(customer_id=customer_id).order_by('-created_at')
-        unread_count = Notification.objects.filter(customer_id=customer_id, is_read=False).count()
+        # 🔔 One page of the feed + the maintained unread counter (no COUNT over the history)
+        paginator = NotificationFeedPagination()
+        page = paginator.paginate_queryset(notifications, request, view=self)
 
         return Response({
             "success": True,
-            "total": unread_count,
-            "data": NotificationSerializer(notifications, many=True).data
+            "total": unread_count(customer_id),
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "data": NotificationSerializer(page, many=True).data
         })
 
 
 
+NOTIFICATION_STREAM_BATCH = 100
+
+
+def _notifications_after(customer_id, last_id):
+    """Serialized notifications with id > last_id (oldest first) and the unread count."""
+    notifications = list(
+        Notification.objects.filter(customer_id=customer_id, id__gt=last_id)
+        .select_related("product", "order")
+        .order_by("id")[:NOTIFICATION_STREAM_BATCH]
+    )
+    return NotificationSerializer(notifications, many=True).data, unread_count(customer_id)
+
+
+def _latest_notification_id(customer_id):
+    return Notification.objects.filter(customer_id=customer_id).order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def _stream_user(request):
+    """
+    The JWT user of a stream request, or None without a token. EventSource
+    cannot set headers, so the access token may also come as ``?token=``.
+    Raises AuthenticationFailed for an invalid token.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else request.GET.get("token")
+    if not raw_token:
+        return None
+    return authenticator.get_user(authenticator.get_validated_token(raw_token))
+
+
+def _owns_customer(user, customer_id):
+    return CustomerDetails.objects.filter(id=customer_id, auth_id=user.id).exists()
+
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def customer_notification_stream(request, customer_id):
+    """
+    SSE feed of a customer's new notifications (ASGI only, see products/push.py).
+    Resumes after ``Last-Event-ID`` / ``?last_id=``; otherwise starts from now.
+    Authenticated with the access token (header or ``?token=``) of the
+    customer's own account.
+    """
+    try:
+        user = await sync_to_async(_stream_user)(request)
+    except AuthenticationFailed:
+        user = None
+    if user is None:
+        return HttpResponse("Authentication credentials were not provided or are invalid", status=401)
+    if not await sync_to_async(_owns_customer)(user, customer_id):
+        return HttpResponse("Not allowed to read this customer's notifications", status=403)
+
+    last_id = request.headers.get("Last-Event-ID") or request.GET.get("last_id")
+
+    async def events(last_id):
+        # Subscribe first, so nothing created while we read is missed
+        queue = hub.subscribe(customer_id)
+        try:
+            if last_id is None:
+                last_id = await sync_to_async(_latest_notification_id)(customer_id)
+            yield "retry: 5000\n\n"
+
+            while True:
+                # 📨 Everything after the last sent id (also covers resumes)
+                rows, unread = await sync_to_async(_notifications_after)(customer_id, last_id)
+                for row in rows:
+                    last_id = row["id"]
+                    yield _sse("notification", row, event_id=last_id)
+                if rows:
+                    yield _sse("unread", {"total": unread})
+                if len(rows) == NOTIFICATION_STREAM_BATCH:
+                    continue
+
+                # 💤 Wait for a wake-up; comment lines keep proxies from closing the stream
+                while True:
+                    try:
+                        await asyncio.wait_for(queue.get(), timeout=heartbeat_interval())
+                        break
+                    except asyncio.TimeoutError:
+                        yield ": ping\n\n"
+                while not queue.empty():
+                    queue.get_nowait()
+        finally:
+            hub.unsubscribe(customer_id, queue)
+
+    try:
+        last_id = int(last_id) if last_id is not None else None
+    except ValueError:
+        return HttpResponse("Invalid last_id", status=400)
+
+    response = StreamingHttpResponse(events(last_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: flush every event
+    return response
+
+
 class MarkNotificationRead(APIView):
     def put(self, request, id):
         try:
@@ -1558,26 +1624,24 @@ class MarkNotificationRead(APIView):
         
 class MarkAllNotificationsRead(APIView):
     def put(self, request, customer_id):
-        Notification.objects.filter(customer_id=customer_id, is_read=False).update(is_read=True)
+        mark_all_read(customer_id)
 
         return Response({"success": True})
 
 class DeleteNotification(APIView):
     def delete(self, request, id):
         try:
-            Notification.objects.get(id=id).delete()
+            delete_notification(Notification.objects.get(id=id))
             return Response({"success": True})
         except Notification.DoesNotExist:
             return Response({"success": False, "message": "Not found"}, status=404)
 
 class ClearAllNotifications(APIView):
     def delete(self, request, customer_id):
-        Notification.objects.filter(customer_id=customer_id).delete()
+        clear_notifications(customer_id)
         return Response({"success": True})
 
 
-RESERVATION_MINUTES = 10
-
 class CheckoutInitiate(APIView):
 
     def post(self, request):
@@ -1605,70 +1669,8 @@ class CheckoutInitiate(APIView):
         if not cart_map:
             return Response({"status": False, "message": "No valid items"}, status=status.HTTP_400_BAD_REQUEST)
 
-        updated_items = []
-        removed_items = []
-        reserved_items = []
-
-        # We'll run everything inside a DB transaction and lock product rows to avoid races
-        with transaction.atomic():
-            # Lock product rows in a deterministic order to avoid deadlocks
-            products_qs = Product.objects.select_for_update().filter(id__in=list(cart_map.keys())).order_by('id')
-
-            # Build map of product objects
-            products = {p.id: p for p in products_qs}
-
-            now = timezone.now()
-            expire_at = now + timedelta(minutes=RESERVATION_MINUTES)
-
-            for pid, requested_qty in cart_map.items():
-                product = products.get(pid)
-                if not product:
-                    removed_items.append(pid)
-                    continue
-
-                # Clear expired reservations for this product (so availability is accurate)
-                ProductReservation.objects.filter(product=product, reserved_until__lt=now).delete()
-
-                # compute reserved quantity by others (exclude this user)
-                reserved_by_others = ProductReservation.objects.filter(
-                    product=product,
-                    reserved_until__gt=now
-                ).exclude(user=user).aggregate(total=Sum("quantity"))["total"] or 0
-
-                available = product.stock_quantity - reserved_by_others
-                if available <= 0:
-                    # not available at all: remove from cart
-                    removed_items.append(pid)
-                    # also remove any existing reservation by this user (if present)
-                    ProductReservation.objects.filter(product=product, user=user).delete()
-                    continue
-
-                # If requested > available -> reduce
-                reserve_qty = min(requested_qty, available)
-                if reserve_qty < requested_qty:
-                    updated_items.append({"id": pid, "old_qty": requested_qty, "new_qty": reserve_qty})
-
-                # create or update a reservation for this user/product
-                pr, created = ProductReservation.objects.get_or_create(
-                    product=product,
-                    user=user,
-                    defaults={"quantity": reserve_qty, "reserved_until": expire_at}
-                )
-                if not created:
-                    # update existing reservation to new qty and extend time
-                    pr.quantity = reserve_qty
-                    pr.reserved_until = expire_at
-                    pr.save()
-
-                # Prepare reserved item details to return to client
-                reserved_items.append({
-                    "product_id": pid,
-                    "qty": reserve_qty,
-                    "product_name": product.product_name,
-                    "price": str(product.price),         # JSON friendly
-                    "offer_price": str(product.offer_price) if hasattr(product, "offer_price") and product.offer_price is not None else None,
-                    "product_image": product.product_image.url if product.product_image else None,
-                })
+        # Whole cart in one locking read + one upsert (products/inventory.py)
+        reserved_items, updated_items, removed_items = reserve_cart(user, cart_map)
 
         return Response({
             "status": True,
@@ -1691,14 +1693,17 @@ class CheckoutValidate(APIView):
             return Response({"status": False, "message": "User not found"}, status=400)
 
         now = timezone.now()
-        cart = ProductReservation.objects.filter(user=user)
+        cart = list(ProductReservation.objects.filter(user=user))
+
+        # Stock left after other users' holds, for the whole cart at once
+        products = Product.objects.filter(id__in=[r.product_id for r in cart]).with_available_stock(for_user=user).in_bulk()
 
         removed_items = []
         updated_items = []
         valid_items = []
 
         for r in cart:
-            product = r.product
+            product = products[r.product_id]
 
             # 1) Expired reservation
             if r.reserved_until < now:
@@ -1707,12 +1712,7 @@ class CheckoutValidate(APIView):
                 continue
 
             # 2) Check if stock still valid
-            reserved_by_others = ProductReservation.objects.filter(
-                product=product,
-                reserved_until__gt=now
-            ).exclude(user=user).aggregate(total=Sum("quantity"))["total"] or 0
-
-            available = product.stock_quantity - reserved_by_others
+            available = product.available_qty
 
             if available <= 0:
                 removed_items.append(product.id)
@@ -1740,334 +1740,32 @@ class CheckoutValidate(APIView):
 def mark_order_as_printed(order_ids):
     OrderDetails.objects.filter(id__in=order_ids).update(is_printed=True)
 
-import re
-
-
-def extract_location_details(address):
-    if not address:
-        return {"district": "", "pincode": ""}
-
-    location = {
-        "district": "",
-        "pincode": ""
-    }
-
-    # Extract pincode (6 digits)
-    pincode_match = re.search(r'\b(\d{6})\b', address)
-    if pincode_match:
-        location["pincode"] = pincode_match.group(1)
-
-    # Convert to lowercase for matching
-    addr = address.lower()
-
-    # Split by comma AND by hyphen to catch patterns like "salem - 636015"
-    parts = re.split(r'[,-]', addr)
-
-    # Clean parts
-    clean_parts = [p.strip() for p in parts if p.strip()]
-
-    # Find the district:
-    # Rule: the part *just before* the pincode or hyphen
-    for part in clean_parts:
-        if location["pincode"] in part:
-            continue  # skip pincode part
-
-    # Find district by scanning for valid words
-    for part in clean_parts:
-        # Skip numeric-only elements or pure door numbers
-        if part.replace("/", "").isdigit():
-            continue
-
-        # Skip long area descriptions
-        if len(part.split()) > 3:
-            continue
-        
-        # District candidate: the last short text part
-        district_candidate = part.strip()
-        if len(district_candidate) > 2:
-            location["district"] = district_candidate
-            break
-
-    return location
-
 class PrintAddressPDFView(APIView):
     def post(self, request):
-        import os, math
-        from io import BytesIO
-        from reportlab.platypus import Table, TableStyle, Paragraph
-        from reportlab.lib import colors
-        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import mm
-        from reportlab.pdfgen import canvas
-
         # -------------------------- FETCH ORDERS --------------------------
         order_ids = request.data.get("order_ids", [])
-        orders_qs = OrderDetails.objects.filter(id__in=order_ids)
 
-        if not orders_qs.exists():
+        if not OrderDetails.objects.filter(id__in=order_ids).update(is_printed=True):
             return HttpResponse("No orders found", status=404)
 
-        orders_qs.update(is_printed=True)
-
-        # -------------------------- STYLES --------------------------
-        wrap_style = ParagraphStyle(
-            name="wrap_style",
-            fontName="Helvetica",
-            fontSize=9,
-            leading=10
-        )
-
-        styles = getSampleStyleSheet()
-        normal = styles["Normal"]
-        normal.fontName = "Helvetica"
-        normal.fontSize = 11
-        normal.leading = 14
-
-        bold = styles["BodyText"]
-        bold.fontName = "Helvetica-Bold"
-        bold.fontSize = 13
-        bold.leading = 16
-
-        company = {
-            "name": "Vallalar Naturals from Village Kannama",
-            "address": "Vadalur - 607303.",
-            "phone": "+91 7639157615",
-        }
-
-        logo_path = os.path.join(settings.BASE_DIR, "static", "image", "Logo.jpeg")
-
-        # -------------------------- PARSE ORDERS --------------------------
-        parsed_orders = []
-        for o in orders_qs:
-            loc = extract_location_details(o.shipping_address)
-            items = []
-
-            for itm in o.items.all():
-                qty_clean = str(itm.product.quantity).rstrip("0").rstrip(".")
-                unit = itm.product.quantity_unit or ""
-                clean_name = itm.product.product_name.replace("_", " ").title()
-                product_name = f"{clean_name} ({qty_clean} {unit})" if unit else clean_name
-
-                items.append({"product": product_name, "qty": itm.quantity})
-
-            parsed_orders.append({
-                "order_obj": o,
-                "name": f"{o.first_name or ''} {o.last_name or ''}",
-                "address": o.shipping_address or "",
-                "district": loc.get("district", ""),
-                "pincode": loc.get("pincode", ""),
-                "phone": o.contact_number,
-                "order_number": o.order_number,
-                "courier_service": o.preferred_courier_service,
-                "items": items
-            })
-
-        # -------------------------- PDF SETUP --------------------------
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        page_w, page_h = A4
+        if is_async(request):
+            return export_queued(request, enqueue_export(ExportJob.Kind.ADDRESS_LABELS, order_ids=order_ids))
 
-        block_w = 105 * mm
-        block_h = 148.5 * mm
+        # -------------------------- DRAW & STREAM --------------------------
+        # products/labels.py: prefetched in chunks, spooled to a temp file
+        labels = write_address_labels(label_orders(order_ids))
 
-        positions = [
-            (0, block_h), (block_w, block_h),
-            (0, 0), (block_w, 0)
-        ]
-
-        BLOCK_WITH_HEADER_MAX = 4
-        BLOCK_TABLE_ONLY_MAX = 20
-        PRODUCT_COL_PADDING = 15 * mm
-
-        # -------------------------- UTILS --------------------------
-        def paragraph_lines_count(text, col_w):
-            p = Paragraph(text, wrap_style)
-            p.wrap(col_w, 9999)
-            h = p.height
-            lines = max(1, math.ceil(h / wrap_style.leading))
-            return lines, p
-
-        # -------------------------- FIXED HEADER (with wrap) --------------------------
-        def draw_paragraph(text, style, x, y, max_w, max_h):
-            p = Paragraph(text, style)
-            p.wrap(max_w, max_h)
-            p.drawOn(c, x, y)
-            return p.height  # Return height used
-
-        def draw_header(tx, ty, order):
-            """
-            Compact From/To header with controlled spacing.
-            Uses the same behaviour as your working 'write()' style.
-            """
-            avail = block_w - 20*mm  # width available inside block
-
-            def draw(text, style, reduce_mm):
-                nonlocal ty
-                p = Paragraph(text, style)
-                p.wrap(avail, 9999)      # ensure wrap happens BEFORE draw (prevents blPara error)
-                p.drawOn(c, tx, ty)
-                ty -= reduce_mm          # controlled spacing in mm
-
-            # ---------- FROM ----------
-            draw("<b>From:</b>", bold, 5*mm)
-            draw(company["name"], normal, 6*mm)
-            draw(company["address"], normal, 6*mm)
-            draw(f"Phone: {company['phone']}", normal, 8*mm)
-
-            # ---------- TO ----------
-            draw("<b>To:</b>", bold, 5*mm)
-            draw(order["name"], normal, 10*mm)
-            draw(order["address"], normal, 6*mm)
-            draw(f"District: {order['district']}", normal, 5*mm)
-            draw(f"Pincode: {order['pincode']}", normal, 5*mm)
-            draw(f"Phone: +91 {order['phone']}", normal, 10*mm)
-
-            # ---------- ORDER DETAILS ----------
-            draw(f"<b>Courier Name: {order['courier_service']}</b>", bold, 8*mm)
-            draw(f"<b>Order No: {order['order_number']}</b>", bold, 8*mm)
-
-            return ty
-
-
-        # -------------------------- TABLE DRAW --------------------------
-        def draw_table(tx, ty_top, rows, avail_w):
-            col_product = avail_w - PRODUCT_COL_PADDING
-            data = [["Product", "Qty"]]
-
-            for it in rows:
-                data.append([Paragraph(it["product"], wrap_style), str(it["qty"])])
-
-            tbl = Table(data, colWidths=[col_product, PRODUCT_COL_PADDING])
-            tbl.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 0.3, colors.black),
-            ]))
-
-            tw, th = tbl.wrap(avail_w, 9999)
-            tbl.drawOn(c, tx, ty_top - th)
-            return th
-
-        # -------------------------- PAGE START --------------------------
-        def draw_separators():
-            c.setDash(2, 2)
-            c.line(block_w, 0, block_w, page_h)
-            c.line(0, block_h, page_w, block_h)
-            c.setDash()
-
-        first_page = True
-        def start_page():
-            nonlocal first_page
-            if not first_page:
-                c.showPage()
-            draw_separators()
-            first_page = False
-
-        start_page()
-
-        block_index = 0
-        order_counter = 1
-
-        # -------------------------- MAIN LOOP --------------------------
-        for order in parsed_orders:
-            items = order["items"][:]
-            block_no = 1
-
-            # HEADER BLOCK
-            if block_index >= 4:
-                block_index = 0
-                start_page()
-
-            x, y = positions[block_index]
-            c.rect(x, y, block_w, block_h)
-
-            # header position
-            tx = x + 10*mm
-            ty = y + block_h - 12*mm
-
-            ty_after = draw_header(tx, ty, order)
-
-            avail = block_w - 20 * mm
-            product_col_w = avail - PRODUCT_COL_PADDING
-
-            placed = []
-            used_rows = 0
-
-            while items and used_rows < BLOCK_WITH_HEADER_MAX:
-                lines, _ = paragraph_lines_count(items[0]["product"], product_col_w)
-                if used_rows + lines <= BLOCK_WITH_HEADER_MAX:
-                    placed.append(items.pop(0))
-                    used_rows += lines
-                else:
-                    break
-
-            if placed:
-                draw_table(tx, ty_after, placed, avail)
-
-            # FOOTER centered
-            footer = f"C{order_counter}-{block_no}"
-            c.setFont("Helvetica", 7)
-            fw = c.stringWidth(footer, "Helvetica", 7)
-            c.drawString(x + 3*mm, y + 3*mm, footer)
-
-            block_no += 1
-            block_index += 1
-
-            # TABLE ONLY BLOCKS
-            while items:
-                if block_index >= 4:
-                    block_index = 0
-                    start_page()
-
-                x2, y2 = positions[block_index]
-                c.rect(x2, y2, block_w, block_h)
-
-                tx2 = x2 + 10*mm
-                ty2 = y2 + block_h - 12*mm
-
-                take = []
-                used = 0
-
-                while items and used < BLOCK_TABLE_ONLY_MAX:
-                    lines, _ = paragraph_lines_count(items[0]["product"], product_col_w)
-                    if used + lines <= BLOCK_TABLE_ONLY_MAX:
-                        take.append(items.pop(0))
-                        used += lines
-                    else:
-                        break
-
-                draw_table(tx2, ty2, take, avail)
-
-                foot = f"C{order_counter}-{block_no}"
-                c.setFont("Helvetica", 7)
-                c.drawString(x2 + 3*mm, y2 + 3*mm, foot)
-
-                block_no += 1
-                block_index += 1
-
-            order_counter += 1
-
-        # -------------------------- END --------------------------
-        c.save()
-        buffer.seek(0)
-        return HttpResponse(buffer,
+        return FileResponse(
+            labels,
+            as_attachment=True,
+            filename="address_labels.pdf",
             content_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=address_labels.pdf"}
         )
 
 
 
 class PrintSingleAddressPDFView(APIView):
     def post(self, request):
-        from reportlab.platypus import Table, TableStyle, Paragraph
-        from reportlab.lib import colors
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-        from reportlab.lib.units import mm
-        from reportlab.pdfgen import canvas
-
         order_id = request.data.get("order_id")
         if not order_id:
             return HttpResponse("Order ID missing", 400)
@@ -2079,149 +1777,14 @@ class PrintSingleAddressPDFView(APIView):
         except:
             return HttpResponse("Order not found", 404)
 
-        # -------- STYLES --------
-        styles = getSampleStyleSheet()
-        normal = styles["Normal"]
-        normal.fontName = "Helvetica"
-        normal.fontSize = 11
-        normal.leading = 12
-
-        bold = styles["BodyText"]
-        bold.fontName = "Helvetica-Bold"
-        bold.fontSize = 13
-        bold.leading = 16
-
-        wrap_style = ParagraphStyle(
-            "wrap_style",
-            fontName="Helvetica",
-            fontSize=10,
-            leading=12
-        )
-
-        # -------- COMPANY --------
-        company = {
-            "name": "Vallalar Naturals from Village Kannama",
-            "address": "Vadalur - 607303.",
-            "phone": "+91 7639157615",
-        }
+        if is_async(request):
+            return export_queued(request, enqueue_export(ExportJob.Kind.SINGLE_LABEL, order_id=o.id))
 
-        # -------- LOCATION --------
-        loc = extract_location_details(o.shipping_address)
-
-        # -------- BUILD ITEMS --------
-        items = []
-        for item in o.items.all():
-            qty_clean = str(item.product.quantity).rstrip("0").rstrip(".")
-            unit = item.product.quantity_unit or ""
-            clean = item.product.product_name.replace("_", " ").title()
-            prod = f"{clean} ({qty_clean} {unit})"
-            items.append({"product": prod, "qty": item.quantity})
-
-        # -------- PDF SETUP --------
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        page_w, page_h = A4
-
-        MAX_FIRST_PAGE_ROWS = 33
-        MAX_SECOND_PAGE_ROWS = 40
-
-        # -------- COUNT WRAP ROWS --------
-        def count_lines(text, width):
-            p = Paragraph(text, wrap_style)
-            _, h = p.wrap(width, 9999)
-            lines = max(1, int(h / wrap_style.leading))
-            return lines, p
-
-        col_width = 140 * mm
-        visual_rows = []
-
-        for it in items:
-            lines, p = count_lines(it["product"], col_width)
-            visual_rows.append({"product": p, "qty": str(it["qty"]), "lines": lines})
-
-        # SPLIT INTO TWO PAGES
-        page1_rows, page2_rows = [], []
-        total = 0
-        for row in visual_rows:
-            if total + row["lines"] <= MAX_FIRST_PAGE_ROWS:
-                page1_rows.append(row)
-                total += row["lines"]
-            else:
-                page2_rows.append(row)
-
-        # -------- HEADER BLOCK --------
-        def draw_header():
-            tx = 15 * mm
-            ty = page_h - 15 * mm
-
-            def write(text, style, reduce):
-                nonlocal ty
-                p = Paragraph(text, style)
-                p.wrap(page_w - 30 * mm, 9999)
-                p.drawOn(c, tx, ty)
-                ty -= reduce
-
-            write("<b>From:</b>", bold, 5*mm)
-            write(company["name"], normal, 6*mm)
-            write(company["address"], normal, 6*mm)
-            write(f"Phone: {company['phone']}", normal, 8*mm)
-
-            write("<b>To:</b>", bold, 5*mm)
-            write(f"{o.first_name} {o.last_name}", normal, 6*mm)
-            write(o.shipping_address, normal, 6*mm)
-            write(f"District: {loc['district']}", normal, 5*mm)
-            write(f"Pincode: {loc['pincode']}", normal, 5*mm)
-            write(f"Phone: +91 {o.contact_number}", normal, 10*mm)
-
-            write(f"<b>Order No: {o.order_number}</b>", bold, 10*mm)
-            write(f"<b>Courier Name: {o.preferred_courier_service}</b>", bold, 10*mm)
-
-            return tx, ty
-
-        # -------- PAGE 1 --------
-        tx, ty = draw_header()
-
-        table_data = [["Product", "Qty"]]
-        for r in page1_rows:
-            table_data.append([r["product"], r["qty"]])
-
-        table = Table(table_data, colWidths=[140*mm, 40*mm])
-        table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ]))
-
-        tw, th = table.wrap(page_w - 30*mm, 9999)
-        table.drawOn(c, tx, ty - th)
-
-        # -------- PAGE 2 --------
-        if page2_rows:
-            c.showPage()
-
-            table_data2 = [["Product", "Qty"]]
-            for r in page2_rows:
-                table_data2.append([r["product"], r["qty"]])
-
-            table2 = Table(table_data2, colWidths=[140*mm, 40*mm])
-            table2.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ]))
-
-            tw2, th2 = table2.wrap(page_w - 30*mm, 9999)
-            table2.drawOn(c, 15*mm, page_h - 30*mm - th2)
-
-        c.save()
-        buffer.seek(0)
-
-        return HttpResponse(
-            buffer,
+        return FileResponse(
+            write_single_label(o),
+            as_attachment=True,
+            filename="single_address_label.pdf",
             content_type="application/pdf",
-            headers={"Content-Disposition": "attachment; filename=single_address_label.pdf"}
         )
 
 